@@ -104,22 +104,68 @@ export const imageAPI = {
         }
     },
 
-    // Poll job until completion
+    // Wait for job completion from its event stream, polling where EventSource is unavailable
     async waitForJob(jobId, onProgress, pollInterval = 2000) {
+        const status = typeof EventSource === 'undefined'
+            ? await this.pollJob(jobId, onProgress, pollInterval)
+            : await this.streamJob(jobId, onProgress).catch(() => this.pollJob(jobId, onProgress, pollInterval));
+
+        await this.deleteJob(jobId);
+        if (status.overall_status === 'FAILED') {
+            throw new Error(status.main_image.error_message || 'Upload failed');
+        }
+        return {
+            mainImageId: status.main_image.gridfs_id,
+            thumbnailId: status.thumbnail.gridfs_id,
+        };
+    },
+
+    // Resolve with the last status sent before the server closes the job's event stream.
+    // Rejects when no event arrives for `idleTimeout` ms, so the caller can fall back to polling.
+    streamJob(jobId, onProgress, idleTimeout = 30000) {
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(`${API_BASE_URL}/api/album/image/job/${jobId}/events`);
+            let status = null;
+            let timer = null;
+
+            const fail = (message) => {
+                clearTimeout(timer);
+                source.close();
+                reject(new Error(message));
+            };
+            const restartTimer = () => {
+                clearTimeout(timer);
+                timer = setTimeout(() => fail('Job event stream timed out'), idleTimeout);
+            };
+            restartTimer();
+
+            source.addEventListener('job', (event) => {
+                status = JSON.parse(event.data);
+                restartTimer();
+                if (onProgress) onProgress(status);
+            });
+            source.onerror = () => {
+                // Also fired when the server ends the stream after the final event
+                if (status && status.overall_status !== 'PROCESS') {
+                    clearTimeout(timer);
+                    source.close();
+                    resolve(status);
+                } else {
+                    fail('Job event stream failed');
+                }
+            };
+        });
+    },
+
+    // Poll job until completion
+    async pollJob(jobId, onProgress, pollInterval = 2000) {
         while (true) {
             const status = await this.getJobStatus(jobId);
 
             if (onProgress) onProgress(status);
             
-            if (status.overall_status === 'SUCCESS') {
-                await this.deleteJob(jobId);
-                return {
-                    mainImageId: status.main_image.gridfs_id,
-                    thumbnailId: status.thumbnail.gridfs_id,
-                };
-            } else if (status.overall_status === 'FAILED') {
-                await this.deleteJob(jobId);
-                throw new Error(status.main_image.error_message || 'Upload failed');
+            if (status.overall_status !== 'PROCESS') {
+                return status;
             }
 
             await new Promise((resolve) => setTimeout(resolve, pollInterval));
@@ -129,10 +175,12 @@ export const imageAPI = {
     // Get full-size image
     async getImage(albumId, imageId) {
         try {
-            const response = await axios.post(
-                `${API_BASE_URL}/api/album/image/get`,
-                { album_id: albumId, image_id: imageId },
-                { responseType: 'blob' }
+            // GET by GridFS id so the browser can cache the immutable file. The width
+            // hint lets the server send a smaller rendition to small screens.
+            const width = Math.round(window.innerWidth * (window.devicePixelRatio || 1));
+            const response = await axios.get(
+                `${API_BASE_URL}/api/album/image/file/${imageId}`,
+                { params: { w: width }, responseType: 'blob' }
             );
             console.log("Get Image: ", response)
             return URL.createObjectURL(response.data);
@@ -144,9 +192,8 @@ export const imageAPI = {
     // Get thumbnail
     async getThumbnail(thumbnailId) {
         try {
-            const response = await axios.post(
-                `${API_BASE_URL}/api/album/image/thumbnail/get`,
-                { thumbnail_id: thumbnailId },
+            const response = await axios.get(
+                `${API_BASE_URL}/api/album/image/thumbnail/${thumbnailId}`,
                 { responseType: 'blob' }
             );
             console.log("Get Thumbnail: ", response)
@@ -1,13 +1,17 @@
 from fastapi import APIRouter, HTTPException, Request
 from core.models.album import (
     AlbumCreateRequest,
+    AlbumContentPage,
+    AlbumContentRequest,
     AlbumCreateResponse,
     AlbumDeleteRequest,
+    AlbumDeleteResponse,
     AlbumGetRequest,
-    AlbumOperationResult,
+    AlbumListRequest,
+    AlbumPage,
     Album,
 )
-from core.helper.album import create_album, get_album, delete_album, get_all_albums
+from core.helper.album import create_album, get_album, get_album_content, delete_album, get_all_albums, list_albums, stream_album_events
 from typing import List
 
 router = APIRouter()
@@ -26,6 +30,13 @@ async def get(album_data: AlbumGetRequest, request: Request) -> Album:
         raise HTTPException(status_code=500, detail="Fail to get album")
     return result
 
+@router.post("/content")
+async def content(request: Request, params: AlbumContentRequest) -> AlbumContentPage:
+    result = await get_album_content(params, request)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Album not found")
+    return result
+
 @router.post("/getAll")
 async def getAll(request: Request) -> List[Album]:
     result = await get_all_albums(request)
@@ -33,9 +44,24 @@ async def getAll(request: Request) -> List[Album]:
         raise HTTPException(status_code=500, detail="Failed to get all albums")
     return result
 
+@router.post("/list")
+async def list_page(request: Request, params: AlbumListRequest) -> AlbumPage:
+    result = await list_albums(params, request)
+    if result is None:
+        raise HTTPException(status_code=500, detail="Failed to list albums")
+    return result
+
 @router.post("/delete")
-async def delete(request: Request, album_data: AlbumDeleteRequest) -> AlbumOperationResult:
+async def delete(request: Request, album_data: AlbumDeleteRequest) -> AlbumDeleteResponse:
     result = await delete_album(album_data, request)
     if not result.status:
         raise HTTPException(status_code=500, detail=f"Fail to delete album: {result.message}")
-    return result
\ No newline at end of file
+    return result
+
+@router.get("/{album_id}/events")
+async def album_events(request: Request, album_id: str):
+    """Stream job status changes of an album as Server-Sent Events"""
+    result = await stream_album_events(album_id, request)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Album not found")
+    return result
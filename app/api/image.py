@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Form, UploadFile, File, HTTPException, Request
-from fastapi.responses import StreamingResponse
-from typing import Annotated
+from fastapi import APIRouter, Form, UploadFile, File, HTTPException, Query, Request
+from typing import Annotated, Optional
 
-from core.models.image import AllowedImageFormat, UploadImageParams, DeleteImageParams, GetImageParams, GetThumbnailParams
-from core.helper.image import upload_image, delete_image, get_image, get_thumbnail
+from core.models.image import AllowedImageFormat, UploadImageParams, BatchUploadImageParams, DeleteImageParams, GetImageParams, GetThumbnailParams
+from core.helper.image import upload_image, upload_images, delete_image, get_image, get_thumbnail, get_rendition_response
 from core.helper.converter import Job
+from core.helper.events import open_event_stream
+from core.helper.job_queue import BatchTooLargeError, QueueFullError
 
 router = APIRouter()
 
@@ -13,7 +14,32 @@ async def upload(request: Request, album_id: Annotated[str, Form()], image: Anno
     if image.content_type not in AllowedImageFormat:
         raise HTTPException(status_code=400, detail=f"Unsupport file type: {image.content_type}")
 
-    return await upload_image(UploadImageParams(album_id=album_id, image=image), request)
+    try:
+        return await upload_image(UploadImageParams(album_id=album_id, image=image), request)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many images in conversion, retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+@router.post("/upload/batch")
+async def upload_batch(request: Request, album_id: Annotated[str, Form()], images: Annotated[list[UploadFile], File()]):
+    """Upload several images as one job group, added to the album together"""
+    for image in images:
+        if image.content_type not in AllowedImageFormat:
+            raise HTTPException(status_code=400, detail=f"Unsupport file type: {image.content_type}")
+
+    try:
+        return await upload_images(BatchUploadImageParams(album_id=album_id, images=images), request)
+    except BatchTooLargeError as e:
+        raise HTTPException(status_code=413, detail=f"Too many images in one batch, at most {e.max_size}")
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many images in conversion, retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
 
 @router.post("/delete")
 async def delete(request: Request, params: DeleteImageParams):
@@ -25,52 +51,90 @@ async def delete(request: Request, params: DeleteImageParams):
 @router.post("/get")
 async def get(request: Request, params: GetImageParams):
     result = await get_image(params, request)
-    if isinstance(result, StreamingResponse):
+    if result is not None:
         return result
     raise HTTPException(status_code=404, detail="Image not found")
 
 @router.post("/thumbnail/get")
 async def get_thumbnail_endpoint(request: Request, params: GetThumbnailParams):
     result = await get_thumbnail(params.thumbnail_id, request)
-    if isinstance(result, StreamingResponse):
+    if result is not None:
         return result
     raise HTTPException(status_code=404, detail="Thumbnail not found")
 
+@router.get("/file/{image_id}")
+async def get_image_by_id(request: Request, image_id: str, w: Annotated[Optional[int], Query(gt=0)] = None):
+    """Cacheable download of an image by its GridFS id, scaled down to the width hint `w` if given"""
+    result = await get_rendition_response(image_id, "image", w, request)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return result
+
+@router.get("/thumbnail/{thumbnail_id}")
+async def get_thumbnail_by_id(request: Request, thumbnail_id: str, w: Annotated[Optional[int], Query(gt=0)] = None):
+    """Cacheable download of a thumbnail by its GridFS id, scaled down to the width hint `w` if given"""
+    result = await get_rendition_response(thumbnail_id, "thumbnail", w, request)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    return result
+
+@router.get("/stats")
+async def get_stats(request: Request):
+    """Get conversion queue depth and wait times, file cache counters, event stream subscribers and rendition state"""
+    converter = request.app.state.converter
+    image_client = request.app.state.image_client
+    return {
+        "queue": converter.queue_stats(),
+        "cache": image_client.cache_stats(),
+        "events": converter.events.stats(),
+        "renditions": request.app.state.renditions.stats()
+    }
+
 @router.get("/job/{job_id}")
 async def get_job_status(request: Request, job_id: str):
     """Get the status of an image conversion job"""
     converter = request.app.state.converter
-    job: Job = converter.getJob(job_id)
+    job: Job = await converter.getJob(job_id)
 
     if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    response = {
-        "job_id": job.id,
-        "overall_status": job.status.name,
-        "main_image": {
-            "status": job.main_image.status.name,
-            "gridfs_id": job.main_image.gridfs_id,
-            "error_message": job.main_image.error_message
-        },
-        "thumbnail": {
-            "status": job.thumbnail.status.name,
-            "gridfs_id": job.thumbnail.gridfs_id,
-            "error_message": job.thumbnail.error_message
-        },
-        "album_association": {
-            "associated": job.album_association.associated if job.album_association else False,
-            "error_message": job.album_association.error_message if job.album_association else None
-        } if job.album_association else None
-    }
+    return job.to_response()
 
-    return response
+@router.get("/job/{job_id}/events")
+async def stream_job_events(request: Request, job_id: str):
+    """Stream the status changes of a job as Server-Sent Events, until it finishes"""
+    converter = request.app.state.converter
+    result = await open_event_stream(converter.events, f"job:{job_id}", lambda: converter.getJob(job_id), until_final=job_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return result
+
+@router.get("/group/{group_id}")
+async def get_group_status(request: Request, group_id: str):
+    """Get the aggregate status of a batch upload"""
+    converter = request.app.state.converter
+    group = await converter.getGroup(group_id)
+
+    if group is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+
+    return group.to_response(await converter.getGroupJobs(group))
+
+@router.get("/group/{group_id}/events")
+async def stream_group_events(request: Request, group_id: str):
+    """Stream the status changes of a batch upload and of its jobs as Server-Sent Events, until it finishes"""
+    converter = request.app.state.converter
+    result = await open_event_stream(converter.events, f"group:{group_id}", lambda: converter.getGroup(group_id), until_final=group_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+    return result
 
 @router.delete("/job/{job_id}")
 async def delete_job(request: Request, job_id: str):
-    """Delete a job from memory (useful after retrieving results)"""
+    """Delete a job from the job store (useful after retrieving results)"""
     converter = request.app.state.converter
-    success = converter.delete_job(job_id)
+    success = await converter.delete_job(job_id)
 
     if not success:
         raise HTTPException(status_code=404, detail="Job not found")
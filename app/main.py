@@ -2,32 +2,104 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.middleware.error_middleware import ErrorMiddleware
+from app.middleware.metrics_middleware import MetricsMiddleware
 from app.middleware.response_middleware import ResponseMiddleware
-from starlette.responses import RedirectResponse
+from starlette.responses import RedirectResponse, Response
 from app.api import router as api_router
-from core.mongo.Album import AlbumClient
+from core.mongo.Album import AlbumClient, MembershipAlbumClient
 from core.mongo.Image import ImageClient
+from core.mongo.Job import MongoJobStore
+from core.helper.album import resume_album_deletions
+from core.helper.cache import ByteLRUCache
 from core.helper.converter import Converter
-import asyncio
+from core.helper.engine import create_engine
+from core.helper.job_store import InMemoryJobStore
+from core.helper.metrics import monitor_event_loop, register_app_collector, render_metrics, unregister_collector
+from core.helper.render import get_profile
+from core.helper.rendition import RenditionLadder
+import asyncio, os
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    app.state.album_client = AlbumClient()
+    # ALBUM_STORAGE: "embedded" keeps images in the album's content array (default),
+    # "collection" keeps them in the indexed album_image collection, migrated once on first startup.
+    # There is no way back: the migration empties the content arrays, "embedded" then shows empty albums.
+    if os.getenv("ALBUM_STORAGE", "embedded") == "collection":
+        app.state.album_client = MembershipAlbumClient()
+    else:
+        app.state.album_client = AlbumClient()
     await app.state.album_client.init()
 
-    app.state.image_client = ImageClient()
+    # IMAGE_CACHE_MAX_BYTES=0 disables the in-process file cache
+    cache_max_bytes = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    image_cache = ByteLRUCache(
+        max_bytes=cache_max_bytes,
+        max_item_bytes=int(os.getenv("IMAGE_CACHE_MAX_ITEM_BYTES", str(256 * 1024))),
+        ttl_seconds=float(os.getenv("IMAGE_CACHE_TTL_SECONDS", "0"))
+    ) if cache_max_bytes > 0 else None
+
+    app.state.image_client = ImageClient(cache=image_cache)
     await app.state.image_client.init()
 
-    main_loop = asyncio.get_running_loop()
+    # CONVERTER_ENGINE: "thread" (default) or "process", CONVERTER_WORKERS: 0 sizes the pool automatically
+    engine = create_engine(
+        os.getenv("CONVERTER_ENGINE", "thread"),
+        max_workers=int(os.getenv("CONVERTER_WORKERS", "0")) or None
+    )
+
+    # JOB_STORE: "memory" (default) keeps jobs in this process, "mongo" shares them
+    # between workers and keeps them across restarts
+    job_ttl_seconds = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+    if os.getenv("JOB_STORE", "memory") == "mongo":
+        job_store = MongoJobStore(ttl_seconds=job_ttl_seconds)
+    else:
+        job_store = InMemoryJobStore()
+    await job_store.init()
+
     app.state.converter = Converter(
         image_client=app.state.image_client,
-        main_event_loop=main_loop
+        job_ttl_seconds=job_ttl_seconds,
+        job_store=job_store,
+        engine=engine,
+        max_queue_depth=int(os.getenv("CONVERTER_QUEUE_DEPTH", "256")),
+        concurrency=int(os.getenv("CONVERTER_CONCURRENCY", "0")) or None,
+        # CONVERTER_EXPECTED_SERVICE_SECONDS: seconds per job assumed for Retry-After until jobs have been timed
+        expected_service_seconds=float(os.getenv("CONVERTER_EXPECTED_SERVICE_SECONDS", "2")),
+        # ENCODER_*_PROFILE: a profile name from core.helper.render.PROFILES
+        main_profile=get_profile(os.getenv("ENCODER_MAIN_PROFILE", "webp")),
+        thumbnail_profile=get_profile(os.getenv("ENCODER_THUMBNAIL_PROFILE", "webp"))
+    )
+    # RENDITION_WIDTHS: rungs of the ?w= width hint, made on first request from the stored image.
+    # AVIF_OUTPUT=1 also serves AVIF renditions to clients that accept them.
+    app.state.renditions = RenditionLadder(
+        image_client=app.state.image_client,
+        engine=engine,
+        widths=[int(width) for width in os.getenv("RENDITION_WIDTHS", "256,512,1024").split(",") if width.strip()],
+        profile=get_profile(os.getenv("ENCODER_RENDITION_PROFILE", "webp")),
+        avif_profile=get_profile(os.getenv("ENCODER_AVIF_PROFILE", "avif")) if os.getenv("AVIF_OUTPUT", "0") == "1" else None
     )
 
+    # Finished jobs are dropped after JOB_TTL_SECONDS, or earlier once there are more than JOB_MAX_COUNT
+    app.state.converter.start_sweeper(
+        interval_seconds=float(os.getenv("JOB_SWEEP_INTERVAL_SECONDS", "60")),
+        max_jobs=int(os.getenv("JOB_MAX_COUNT", "10000")) or None
+    )
+
+    # Albums deleted before a restart or crash may still have files to delete
+    await resume_album_deletions(app.state.album_client, app.state.image_client, app.state.converter)
+
+    # Queue, engine, cache and event stream state for /metrics, read on each scrape
+    metrics_collector = register_app_collector(app.state.converter, app.state.image_client, app.state.renditions)
+    # EVENT_LOOP_LAG_INTERVAL_SECONDS: how often the event loop lag is sampled
+    loop_monitor = asyncio.create_task(monitor_event_loop(float(os.getenv("EVENT_LOOP_LAG_INTERVAL_SECONDS", "0.5"))))
+
     yield
 
     # Cleanup
-    app.state.converter.shutdown()
+    loop_monitor.cancel()
+    unregister_collector(metrics_collector)
+    await app.state.converter.shutdown()
+    await job_store.close()
     await app.state.album_client.close()
     await app.state.image_client.close()
 
@@ -42,6 +114,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so request timings include every other middleware
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(api_router, prefix="/api")
 
@@ -51,4 +125,9 @@ async def read_root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/metrics")
+async def get_metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
\ No newline at end of file
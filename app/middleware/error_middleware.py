@@ -1,51 +1,79 @@
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
 from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import json
 
 
-class ErrorMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        try:
-            response = await call_next(request)
-
-            if response.status_code >= 400:
-                response_body = b""
-                async for chunk in response.body_iterator:
-                    response_body += chunk
-
-                try:
-                    original_content = json.loads(response_body.decode())
-                    if isinstance(original_content, dict):
-                        message = original_content.get("detail") or original_content.get("message") or str(original_content)
-                    else:
-                        message = str(original_content)
-                except:
-                    message = response_body.decode() if response_body else "Error"
-
-                # error_response = {
-                #     "error_code": response.status_code,
-                #     "message": message
-                # }
-
-                new_headers = dict(response.headers)
-                new_headers.pop("content-length", None)
-
-                return JSONResponse(
-                    content=message,
-                    status_code=response.status_code,
-                    headers=new_headers
-                )
-
-            return response
+class ErrorMiddleware:
+    """Reduce error responses (status >= 400) to their message and turn unhandled exceptions into a 500.
+
+    Successful responses are forwarded as they are produced; only error bodies are buffered.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        error_start: Message | None = None
+        error_body: list[bytes] = []
+        response_sent = False
+
+        async def send_wrapper(message: Message):
+            nonlocal error_start, response_sent
+
+            if message["type"] == "http.response.start" and message["status"] >= 400:
+                error_start = message
+                return
+
+            if message["type"] == "http.response.body" and error_start is not None:
+                error_body.append(message.get("body", b""))
+                if message.get("more_body", False):
+                    return
+                response_sent = True
+                await self._send_error(send, error_start, b"".join(error_body))
+                return
 
+            response_sent = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
         except Exception as e:
+            if response_sent:
+                raise
+
             error_response = {
                 "error_code": 500,
                 "message": str(e)
             }
 
-            return JSONResponse(
+            response = JSONResponse(
                 content=error_response,
                 status_code=500
-            )
\ No newline at end of file
+            )
+            await response(scope, receive, send)
+
+    async def _send_error(self, send: Send, start: Message, response_body: bytes):
+        try:
+            original_content = json.loads(response_body.decode())
+            if isinstance(original_content, dict):
+                message = original_content.get("detail") or original_content.get("message") or str(original_content)
+            else:
+                message = str(original_content)
+        except:
+            message = response_body.decode() if response_body else "Error"
+
+        # Same rendering as JSONResponse
+        body = json.dumps(message, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+        headers = MutableHeaders(raw=list(start.get("headers", [])))
+        headers["content-length"] = str(len(body))
+        if "content-type" not in headers:
+            headers["content-type"] = "application/json"
+
+        await send({"type": "http.response.start", "status": start["status"], "headers": headers.raw})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,51 @@
+from core.helper.metrics import HTTP_REQUEST_SECONDS
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import time
+
+
+class MetricsMiddleware:
+    """Time every HTTP request, labelled by the path template of the route that handled it.
+
+    Requests that match no route share the "unmatched" label so arbitrary paths
+    cannot create new series. Event streams are timed until their headers are
+    sent, they then stay open for as long as the client listens.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status = 500
+        observed = False
+
+        def observe():
+            nonlocal observed
+            observed = True
+            # The router adds the matched route to the scope
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - start_time)
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+
+            await send(message)
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if Headers(raw=message.get("headers", [])).get("content-type", "").startswith("text/event-stream"):
+                    observe()
+            elif message["type"] == "http.response.body" and not message.get("more_body", False) and not observed:
+                observe()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not observed:
+                observe()
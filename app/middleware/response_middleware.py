@@ -1,39 +1,59 @@
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import json
 
 DOC_PATHS = {"/docs", "/redoc", "/openapi.json", "/docs/oauth2-redirect"}
 
-class ResponseMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
+class ResponseMiddleware:
+    """Wrap JSON responses in {"status": ..., "content": ...}.
 
-        if request.url.path in DOC_PATHS or request.url.path.startswith("/static"):
-            return response
+    The content type is checked on the response start message, so images and
+    other streamed bodies pass through without being buffered.
+    """
 
-        if response.headers.get("content-type", "").startswith("application/json"):
-            response_body = b""
-            async for chunk in response.body_iterator:
-                response_body += chunk
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-            try:
-                original_content = json.loads(response_body.decode())
-            except json.JSONDecodeError:
-                original_content = response_body.decode()
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path in DOC_PATHS or path.startswith("/static"):
+            await self.app(scope, receive, send)
+            return
 
-            wrapped_content = {
-                "status": response.status_code,
-                "content": original_content
-            }
+        json_start: Message | None = None
+        json_body: list[bytes] = []
 
-            new_headers = dict(response.headers)
-            new_headers.pop("content-length", None)
+        async def send_wrapper(message: Message):
+            nonlocal json_start
 
-            return JSONResponse(
-                content=wrapped_content,
-                status_code=response.status_code,
-                headers=new_headers
-            )
+            if message["type"] == "http.response.start":
+                content_type = Headers(raw=message.get("headers", [])).get("content-type", "")
+                if content_type.startswith("application/json"):
+                    json_start = message
+                    return
 
-        return response
\ No newline at end of file
+            if message["type"] == "http.response.body" and json_start is not None:
+                json_body.append(message.get("body", b""))
+                if message.get("more_body", False):
+                    return
+                await self._send_wrapped(send, json_start, b"".join(json_body))
+                return
+
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _send_wrapped(self, send: Send, start: Message, response_body: bytes):
+        status = start["status"]
+        if response_body:
+            # The body is already JSON, splice it into the envelope instead of
+            # decoding and re-encoding it.
+            body = b'{"status":%d,"content":%s}' % (status, response_body)
+        else:
+            body = json.dumps({"status": status, "content": ""}, separators=(",", ":")).encode("utf-8")
+
+        headers = MutableHeaders(raw=list(start.get("headers", [])))
+        headers["content-length"] = str(len(body))
+
+        await send({"type": "http.response.start", "status": status, "headers": headers.raw})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,10 @@
+"""Benchmarks of the conversion pipeline and load tests of the API, run by hand rather than as tests.
+
+    python -m bench.corpus --sizes 1,12,48
+    python -m bench.conversion --output bench/baseline.json
+    python -m bench.conversion --baseline bench/baseline.json --stage-threshold end_to_end=0.3
+    python -m bench.load open-album upload-burst --config current: --config nocache:IMAGE_CACHE_MAX_BYTES=0
+
+The load harness needs the packages of bench/requirements.txt. Timings depend
+on the machine, so compare results taken on the same hardware.
+"""
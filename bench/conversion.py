@@ -0,0 +1,203 @@
+from bench import report
+from bench.corpus import DEFAULT_MEGAPIXELS, FORMAT_MODES, generate_corpus, parse_list
+from bench.stubs import StubImageClient
+from core.helper.converter import Converter, Status
+from core.helper.engine import create_engine
+from core.helper.render import (
+    MAIN_SIZE, THUMBNAIL_SIZE, PROFILES, cover_size, encode, fit_size, get_profile, prepare_frame,
+    render_renditions, thumbnail_image
+)
+from datetime import datetime, timezone
+from io import BytesIO
+from PIL import Image
+import argparse, asyncio, logging, os, platform, sys, time
+import PIL, pillow_heif
+
+logger = logging.getLogger(__name__)
+
+
+def time_stages(data: bytes, main_profile, thumbnail_profile) -> dict[str, float]:
+    """Seconds spent in each step of `render_renditions` for one file.
+
+    The steps are the ones `render_renditions` runs, timed separately, plus a
+    call of `render_renditions` itself for the total as the engine runs it.
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    with Image.open(BytesIO(data)) as img:
+        main_size, thumb_size = fit_size(img.size, MAIN_SIZE), cover_size(img.size, THUMBNAIL_SIZE[0])
+        img.draft(None, (max(main_size[0], thumb_size[0]), max(main_size[1], thumb_size[1])))
+        frame = prepare_frame(img, main_profile.keep_alpha)
+        # Already RGB frames are returned as is, still to be decoded
+        frame.load()
+        timings["decode"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        main_img = frame.resize(fit_size(frame.size, MAIN_SIZE), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        thumb_img = thumbnail_image(frame if min(main_img.size) < THUMBNAIL_SIZE[0] else main_img, thumbnail_profile)
+        timings["resize"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encode(main_img, main_profile)
+    encode(thumb_img, thumbnail_profile)
+    timings["encode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    render_renditions(data, main_profile, thumbnail_profile)
+    timings["render"] = time.perf_counter() - start
+
+    return timings
+
+
+async def wait_finished(converter: Converter, job_id: str):
+    queue = converter.events.subscribe(f"job:{job_id}")
+    try:
+        job = await converter.getJob(job_id)
+        while not job.finished:
+            await queue.get()
+            job = await converter.getJob(job_id)
+        return job
+    finally:
+        converter.events.unsubscribe(f"job:{job_id}", queue)
+
+
+async def submit_and_wait(converter: Converter, data: bytes, name: str) -> float:
+    """Seconds from `submit` until the job reaches SUCCESS."""
+    start = time.perf_counter()
+    job_id = await converter.submit(BytesIO(data), name)
+    job = await wait_finished(converter, job_id)
+    elapsed = time.perf_counter() - start
+    if job.status != Status.SUCCESS:
+        raise RuntimeError(f"Conversion of {name} ended with {job.status.name}: {job.main_image.error_message}")
+    return elapsed
+
+
+async def run_converter(files: dict[str, bytes], args, main_profile, thumbnail_profile) -> tuple[dict[str, list[float]], dict]:
+    """End-to-end latencies per case, one job at a time, then the throughput of a burst of every file."""
+    burst_size = len(files) * args.burst_copies
+    converter = Converter(
+        image_client=StubImageClient(upload_latency=args.upload_latency),
+        engine=create_engine(args.engine, max_workers=args.workers or None),
+        max_queue_depth=max(burst_size, 1),
+        main_profile=main_profile,
+        thumbnail_profile=thumbnail_profile
+    )
+    try:
+        latencies = {name: [] for name in files}
+        for _ in range(args.iterations):
+            for name, data in files.items():
+                latencies[name].append(await submit_and_wait(converter, data, name))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            submit_and_wait(converter, data, name)
+            for _ in range(args.burst_copies)
+            for name, data in files.items()
+        ))
+        elapsed = time.perf_counter() - start
+        throughput = {
+            "images": burst_size,
+            "seconds": elapsed,
+            "images_per_sec": burst_size / elapsed,
+            "engine": converter.engine.name,
+            "workers": converter.engine.max_workers
+        }
+        return latencies, throughput
+    finally:
+        await converter.shutdown()
+
+
+def run(args) -> dict:
+    main_profile = get_profile(args.main_profile)
+    thumbnail_profile = get_profile(args.thumbnail_profile)
+
+    entries = generate_corpus(args.corpus, parse_list(args.sizes, float), parse_list(args.formats.upper()))
+    files = {}
+    for entry in entries:
+        with open(os.path.join(args.corpus, entry["file"]), "rb") as f:
+            files[entry["name"]] = f.read()
+
+    cases = {}
+    for entry in entries:
+        name = entry["name"]
+        samples = {}
+        for _ in range(args.iterations):
+            timings = time_stages(files[name], main_profile, thumbnail_profile)
+            for stage, seconds in timings.items():
+                samples.setdefault(stage, []).append(seconds)
+        cases[name] = {stage: report.summarize(values) for stage, values in samples.items()}
+        logger.info(f"{name}: render p50 {cases[name]['render']['p50'] * 1000:.1f} ms")
+
+    throughput = {}
+    latencies, throughput["converter_burst"] = asyncio.run(run_converter(files, args, main_profile, thumbnail_profile))
+    for name, values in latencies.items():
+        cases[name]["end_to_end"] = report.summarize(values)
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "pillow_heif": pillow_heif.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "iterations": args.iterations,
+            "engine": args.engine,
+            "main_profile": args.main_profile,
+            "thumbnail_profile": args.thumbnail_profile,
+            "upload_latency": args.upload_latency
+        },
+        "cases": cases,
+        "throughput": throughput
+    }
+
+
+def parse_thresholds(values: list[str]) -> dict[str, float]:
+    thresholds = {}
+    for value in values:
+        stage, _, limit = value.partition("=")
+        thresholds[stage.strip()] = float(limit)
+    return thresholds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the conversion pipeline on a synthetic corpus")
+    parser.add_argument("--corpus", default="bench/corpus", help="Corpus directory, generated if missing")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_MEGAPIXELS)), help="Sizes in megapixels")
+    parser.add_argument("--formats", default=",".join(FORMAT_MODES), help=f"Any of {', '.join(FORMAT_MODES)}")
+    parser.add_argument("--iterations", type=int, default=5, help="Timed runs per file and stage")
+    parser.add_argument("--burst-copies", type=int, default=2, help="Copies of each file submitted at once for throughput")
+    parser.add_argument("--engine", default="thread", help="Conversion engine of the end-to-end runs")
+    parser.add_argument("--workers", type=int, default=0, help="Engine workers, 0 sizes the pool automatically")
+    parser.add_argument("--upload-latency", type=float, default=0.0, help="Simulated GridFS upload time in seconds")
+    parser.add_argument("--main-profile", default="webp", choices=list(PROFILES))
+    parser.add_argument("--thumbnail-profile", default="webp", choices=list(PROFILES))
+    parser.add_argument("--output", default="bench/results.json", help="Where to write the results")
+    parser.add_argument("--baseline", help="Results to compare against; exits with 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown as a fraction (default 0.2)")
+    parser.add_argument("--stage-threshold", action="append", default=[], metavar="STAGE=FRACTION",
+                        help="Allowed slowdown of one stage, e.g. end_to_end=0.3; repeatable")
+    parser.add_argument("--metric", default="p50", choices=["mean", "p50", "p95", "p99"], help="Statistic compared")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    results = run(args)
+    report.save(results, args.output)
+    print(f"Results written to {args.output}")
+    for name, throughput in results["throughput"].items():
+        print(f"{name}: {throughput['images_per_sec']:.1f} images/sec")
+
+    if args.baseline:
+        differences = report.compare(
+            results, report.load(args.baseline), args.threshold, parse_thresholds(args.stage_threshold), args.metric
+        )
+        print(report.format_comparison(differences))
+        regressions = [diff for diff in differences if diff["regression"]]
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.baseline}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+from core.helper import render  # noqa: F401 - registers the HEIF and AVIF plugins
+from PIL import Image
+from typing import Optional
+import argparse, json, logging, math, os, random
+
+logger = logging.getLogger(__name__)
+
+# Image modes each format can store, as uploads are likely to arrive in them
+FORMAT_MODES = {
+    "JPEG": ["RGB", "CMYK"],
+    "PNG": ["RGB", "RGBA", "P"],
+    "WEBP": ["RGB", "RGBA"],
+    "HEIF": ["RGB", "RGBA"],
+    "AVIF": ["RGB", "RGBA"],
+}
+EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "HEIF": "heic", "AVIF": "avif"}
+DEFAULT_MEGAPIXELS = [1, 12, 48]
+MANIFEST_NAME = "manifest.json"
+
+# Bump when the generated images change, so stale corpora are regenerated
+CORPUS_VERSION = 1
+
+
+def dimensions(megapixels: float) -> tuple[int, int]:
+    """4:3 size of roughly `megapixels` million pixels, like most camera sensors."""
+    width = round(math.sqrt(megapixels * 1_000_000 * 4 / 3))
+    return width, round(width * 3 / 4)
+
+
+def synthetic_image(size: tuple[int, int], mode: str, seed: int = 0) -> Image.Image:
+    """Deterministic image with smooth areas, edges and grain, converted to `mode`.
+
+    Scaled-up fractals alone compress far better than photos, so a tiled noise
+    layer is blended in to give encoders and decoders photo-like entropy.
+    """
+    base = Image.merge("RGB", (
+        Image.effect_mandelbrot((640, 480), (-2.2, -1.2, 1.0, 1.2), 100),
+        Image.linear_gradient("L").resize((640, 480)),
+        Image.radial_gradient("L").resize((640, 480)),
+    )).resize(size, Image.Resampling.BICUBIC)
+
+    rng = random.Random(seed)
+    tile = Image.frombytes("RGB", (256, 256), rng.randbytes(256 * 256 * 3))
+    noise = Image.new("RGB", size)
+    for top in range(0, size[1], 256):
+        for left in range(0, size[0], 256):
+            noise.paste(tile, (left, top))
+    img = Image.blend(base, noise, 0.15)
+
+    if mode == "RGBA":
+        img.putalpha(Image.radial_gradient("L").resize(size))
+        return img
+    if mode == "P":
+        return img.quantize(256)
+    return img.convert(mode)
+
+
+def case_name(fmt: str, mode: str, megapixels: float) -> str:
+    return f"{EXTENSIONS[fmt]}-{mode.lower()}-{megapixels:g}mp"
+
+
+def generate_corpus(directory: str, megapixels: Optional[list[float]] = None,
+                    formats: Optional[list[str]] = None) -> list[dict]:
+    """Write one file per format, mode and size to `directory` and return their descriptions.
+
+    Files already listed in the directory's manifest are kept, so the corpus is
+    only generated once per machine.
+    """
+    megapixels = megapixels or DEFAULT_MEGAPIXELS
+    formats = formats or list(FORMAT_MODES)
+    os.makedirs(directory, exist_ok=True)
+
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    existing = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("version") == CORPUS_VERSION:
+            existing = {entry["name"]: entry for entry in manifest["files"]}
+
+    entries = []
+    for fmt in formats:
+        for mode in FORMAT_MODES[fmt]:
+            for mp in megapixels:
+                name = case_name(fmt, mode, mp)
+                path = os.path.join(directory, f"{name}.{EXTENSIONS[fmt]}")
+                if name in existing and os.path.exists(path):
+                    entries.append(existing[name])
+                    continue
+
+                size = dimensions(mp)
+                img = synthetic_image(size, mode)
+                img.save(path, fmt, **({"quality": 90} if fmt in ("JPEG", "WEBP", "HEIF", "AVIF") else {}))
+                entries.append({
+                    "name": name,
+                    "file": os.path.basename(path),
+                    "format": fmt,
+                    "mode": mode,
+                    "megapixels": mp,
+                    "size": list(size),
+                    "bytes": os.path.getsize(path)
+                })
+                logger.info(f"Generated {name} ({size[0]}x{size[1]}, {entries[-1]['bytes']} bytes)")
+
+    # Keep entries of other sizes and formats so runs with different options share the corpus
+    merged = {**existing, **{entry["name"]: entry for entry in entries}}
+    with open(manifest_path, "w") as f:
+        json.dump({"version": CORPUS_VERSION, "files": list(merged.values())}, f, indent=2)
+    return entries
+
+
+def parse_list(value: str, cast=str) -> list:
+    return [cast(item.strip()) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the synthetic image corpus used by the benchmarks")
+    parser.add_argument("--dir", default="bench/corpus", help="Directory of the corpus (default: bench/corpus)")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_MEGAPIXELS)), help="Sizes in megapixels, e.g. 1,12,48")
+    parser.add_argument("--formats", default=",".join(FORMAT_MODES), help=f"Any of {', '.join(FORMAT_MODES)}")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    entries = generate_corpus(args.dir, parse_list(args.sizes, float), parse_list(args.formats.upper()))
+    print(f"{len(entries)} files in {args.dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+from bench import report
+from bench.corpus import dimensions, synthetic_image
+from bench.standin import memory_mongo
+from collections import Counter
+from contextlib import AsyncExitStack, ExitStack
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Awaitable, Callable, Optional
+from unittest import mock
+import argparse, asyncio, importlib, json, logging, os, time, uuid
+import httpx
+
+logger = logging.getLogger(__name__)
+
+API = "/api"
+
+
+class LoadClient:
+    """HTTP client recording the latency and status of every request by route.
+
+    Routes are named by their template (e.g. "GET /album/image/job/{id}") so
+    requests for different ids are reported together. Requests made while
+    `recording` is off, during scenario setup, are not reported.
+    """
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.recording = True
+        self.samples: dict[str, list[float]] = {}
+        self.statuses: dict[str, Counter] = {}
+
+    async def request(self, route: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, API + url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            logger.debug(f"{route} failed: {e}")
+            response, status = None, type(e).__name__
+
+        if self.recording:
+            self.samples.setdefault(route, []).append(time.perf_counter() - start)
+            self.statuses.setdefault(route, Counter())[str(status)] += 1
+        return response
+
+    async def content(self, route: str, method: str, url: str, **kwargs):
+        """`content` of a wrapped JSON response, None unless it succeeded."""
+        response = await self.request(route, method, url, **kwargs)
+        if response is None or response.status_code != 200:
+            return None
+        return response.json()["content"]
+
+
+class QueueSampler:
+    """Polls /album/image/stats in the background to record the server's conversion queue."""
+
+    def __init__(self, client: httpx.AsyncClient, interval: float):
+        self.client = client
+        self.interval = interval
+        self.depths: list[int] = []
+        self.in_flight: list[int] = []
+        self.first: Optional[dict] = None
+        self.last: Optional[dict] = None
+
+    async def run(self):
+        while True:
+            try:
+                response = await self.client.get(f"{API}/album/image/stats")
+                queue = response.json()["content"]["queue"]
+                self.first = self.first or queue
+                self.last = queue
+                self.depths.append(queue["depth"])
+                self.in_flight.append(queue["in_flight"])
+            except (httpx.HTTPError, KeyError, ValueError) as e:
+                logger.debug(f"Queue sample failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def summary(self) -> dict:
+        if not self.depths:
+            return {}
+        return {
+            "samples": len(self.depths),
+            "max_depth": max(self.depths),
+            "mean_depth": sum(self.depths) / len(self.depths),
+            "max_in_flight": max(self.in_flight),
+            "rejected": self.last["rejected_total"] - self.first["rejected_total"]
+        }
+
+
+@dataclass
+class Scenario:
+    """Load to generate. `setup` prepares data without being measured and returns what `run` needs."""
+    name: str
+    description: str
+    setup: Callable[[LoadClient, argparse.Namespace], Awaitable[dict]]
+    run: Callable[[LoadClient, argparse.Namespace, dict], Awaitable[None]]
+
+
+class ImageSource:
+    """Encoded test image, made unique per upload so no upload is deduplicated by content hash."""
+
+    def __init__(self, megapixels: float):
+        buffer = BytesIO()
+        synthetic_image(dimensions(megapixels), "RGB").save(buffer, "JPEG", quality=90)
+        self.data = buffer.getvalue()
+
+    def next(self) -> bytes:
+        # Decoders stop at the JPEG end-of-image marker, the suffix only changes the hash
+        return self.data + uuid.uuid4().bytes
+
+
+async def create_album(load: LoadClient, prefix: str) -> str:
+    content = await load.content("POST /album/create", "POST", "/album/create", json={"name": f"{prefix}-{uuid.uuid4().hex[:8]}"})
+    if content is None:
+        raise RuntimeError("Could not create an album")
+    return content["album_id"]
+
+
+async def upload(load: LoadClient, album_id: str, source: ImageSource, retries: int = 5) -> Optional[str]:
+    """Upload one image like the web app, retrying after 429 responses, and return its job id."""
+    for _ in range(retries + 1):
+        response = await load.request(
+            "POST /album/image/upload", "POST", "/album/image/upload",
+            data={"album_id": album_id}, files={"image": ("load.jpg", source.next(), "image/jpeg")}
+        )
+        if response is None:
+            return None
+        if response.status_code != 429:
+            return response.json()["content"]["job_id"] if response.status_code == 200 else None
+        await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+    return None
+
+
+async def wait_job(load: LoadClient, job_id: str, interval: float) -> Optional[dict]:
+    while True:
+        status = await load.content("GET /album/image/job/{id}", "GET", f"/album/image/job/{job_id}")
+        if status is None or status["overall_status"] != "PROCESS":
+            return status
+        await asyncio.sleep(interval)
+
+
+async def fill_album(load: LoadClient, album_id: str, count: int, source: ImageSource, options) -> list[dict]:
+    """Upload `count` images in groups, like the batch upload of the web app, and return the album content."""
+    for start in range(0, count, options.batch_size):
+        size = min(options.batch_size, count - start)
+        content = await load.content(
+            "POST /album/image/upload/batch", "POST", "/album/image/upload/batch",
+            data={"album_id": album_id},
+            files=[("images", (f"load{i}.jpg", source.next(), "image/jpeg")) for i in range(size)]
+        )
+        if content is None:
+            raise RuntimeError("Batch upload during setup failed")
+        while True:
+            group = await load.content("GET /album/image/group/{id}", "GET", f"/album/image/group/{content['group_id']}")
+            if group is None or group["overall_status"] != "PROCESS":
+                break
+            await asyncio.sleep(options.poll_interval)
+
+    page = await load.content("POST /album/content", "POST", "/album/content", json={"id": album_id, "limit": 500})
+    return page["items"] if page else []
+
+
+async def setup_upload_burst(load: LoadClient, options) -> dict:
+    return {"album_id": await create_album(load, "burst"), "source": ImageSource(options.image_mp)}
+
+
+async def upload_burst(load: LoadClient, options, state: dict):
+    job_ids = await asyncio.gather(*(upload(load, state["album_id"], state["source"]) for _ in range(options.uploads)))
+    await asyncio.gather(*(wait_job(load, job_id, options.poll_interval) for job_id in job_ids if job_id))
+
+
+async def setup_open_album(load: LoadClient, options) -> dict:
+    album_id = await create_album(load, "open")
+    return {"album_id": album_id, "items": await fill_album(load, album_id, options.thumbnails, ImageSource(options.image_mp), options)}
+
+
+async def open_album(load: LoadClient, options, state: dict):
+    async def user():
+        await load.content("POST /album/get", "POST", "/album/get", json={"id": state["album_id"]})
+        # Browsers open about six connections per host
+        connections = asyncio.Semaphore(options.connections)
+
+        async def thumbnail(thumbnail_id: str):
+            async with connections:
+                await load.request("GET /album/image/thumbnail/{id}", "GET", f"/album/image/thumbnail/{thumbnail_id}")
+
+        await asyncio.gather(*(thumbnail(item["thumbnail_id"]) for item in state["items"]))
+
+    await asyncio.gather(*(user() for _ in range(options.users)))
+
+
+async def setup_album_list(load: LoadClient, options) -> dict:
+    for _ in range(options.albums):
+        await create_album(load, "list")
+    return {}
+
+
+async def album_list(load: LoadClient, options, state: dict):
+    async def user():
+        cursor = None
+        for _ in range(options.pages):
+            page = await load.content("POST /album/list", "POST", "/album/list", json={"limit": 50, "cursor": cursor})
+            # Start over from the first page after the last one
+            cursor = page["next_cursor"] if page else None
+
+    await asyncio.gather(*(user() for _ in range(options.users)))
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (
+    Scenario("upload-burst", "Upload --uploads images at once to one album and poll every job until it finishes",
+             setup_upload_burst, upload_burst),
+    Scenario("open-album", "--users clients each open an album of --thumbnails images and fetch every thumbnail",
+             setup_open_album, open_album),
+    Scenario("album-list", "--users clients each page through a list of --albums albums --pages times",
+             setup_album_list, album_list),
+)}
+
+
+@dataclass
+class Config:
+    """A server configuration to compare: environment overrides and optionally another ASGI app."""
+    name: str
+    env: dict[str, str]
+    app: Optional[str] = None
+
+    @classmethod
+    def parse(cls, value: str) -> "Config":
+        # NAME:KEY=VALUE,KEY=VALUE where KEY "app" names a module:attribute to serve instead of app.main:app
+        name, _, settings = value.partition(":")
+        env = dict(setting.split("=", 1) for setting in settings.split(",") if setting.strip())
+        return cls(name=name, env=env, app=env.pop("app", None))
+
+
+def load_app(path: str):
+    module, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module), attribute or "app")
+
+
+async def run_scenario(scenario: Scenario, options, config: Optional[Config]) -> dict:
+    """Run one scenario against --url, or against the app in this process started with `config`."""
+    async with AsyncExitStack() as stack:
+        limits = httpx.Limits(max_connections=options.max_connections)
+        if options.url:
+            client = httpx.AsyncClient(base_url=options.url, limits=limits, timeout=options.timeout)
+        else:
+            with ExitStack() as setup:
+                # The app reads its configuration in lifespan, so the overrides only have to outlive startup
+                setup.enter_context(mock.patch.dict(os.environ, config.env))
+                if options.mongo == "memory":
+                    stack.enter_context(memory_mongo())
+                app = load_app(config.app or "app.main:app")
+                await stack.enter_async_context(app.router.lifespan_context(app))
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load", timeout=options.timeout)
+        await stack.enter_async_context(client)
+
+        load = LoadClient(client)
+        load.recording = False
+        state = await scenario.setup(load, options)
+        load.recording = True
+
+        sampler = QueueSampler(client, options.sample_interval)
+        sampler_task = asyncio.create_task(sampler.run())
+
+        start = time.perf_counter()
+        try:
+            await scenario.run(load, options, state)
+        finally:
+            sampler_task.cancel()
+        duration = time.perf_counter() - start
+
+    requests = sum(len(samples) for samples in load.samples.values())
+    return {
+        "scenario": scenario.name,
+        "duration": duration,
+        "requests": requests,
+        "requests_per_sec": requests / duration,
+        "routes": {
+            route: {
+                "statuses": dict(load.statuses[route]),
+                "requests_per_sec": len(samples) / duration,
+                **report.summarize(samples)
+            }
+            for route, samples in load.samples.items()
+        },
+        "queue": sampler.summary()
+    }
+
+
+def format_result(result: dict) -> str:
+    lines = [
+        f"{result['scenario']}: {result['requests']} requests in {result['duration']:.1f}s "
+        f"({result['requests_per_sec']:.1f} req/s)",
+        f"  {'route':<36} {'n':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  statuses"
+    ]
+    for route, stats in result["routes"].items():
+        statuses = " ".join(f"{status}:{count}" for status, count in sorted(stats["statuses"].items()))
+        lines.append(
+            f"  {route:<36} {stats['n']:>6} {stats['requests_per_sec']:>8.1f} {stats['p50'] * 1000:>8.1f} "
+            f"{stats['p95'] * 1000:>8.1f} {stats['p99'] * 1000:>8.1f}  {statuses}"
+        )
+    if result["queue"]:
+        queue = result["queue"]
+        lines.append(
+            f"  queue: max depth {queue['max_depth']}, mean depth {queue['mean_depth']:.1f}, "
+            f"max in flight {queue['max_in_flight']}, rejected {queue['rejected']}"
+        )
+    return "\n".join(lines)
+
+
+def as_comparable(results: list[dict]) -> dict:
+    """Scenario results in the shape `report.compare` takes: latencies by route, throughput by scenario."""
+    return {
+        "cases": {f"{result['scenario']} {route}": {"latency": stats} for result in results for route, stats in result["routes"].items()},
+        "throughput": {result["scenario"]: {"requests_per_sec": result["requests_per_sec"]} for result in results}
+    }
+
+
+async def run(options) -> dict:
+    scenarios = [SCENARIOS[name] for name in options.scenarios]
+    configs = [Config.parse(value) for value in options.config] or [Config(name="current", env={})]
+    if options.url and options.config:
+        raise SystemExit("--config only applies to the in-process app, configure the server behind --url instead")
+
+    results = {}
+    for config in configs:
+        results[config.name] = []
+        for scenario in scenarios:
+            logger.info(f"Running {scenario.name} with configuration {config.name}")
+            result = await run_scenario(scenario, options, config)
+            results[config.name].append(result)
+            print(f"[{config.name}] {format_result(result)}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate HTTP load against the API",
+        epilog="Scenarios: " + "; ".join(f"{s.name}: {s.description}" for s in SCENARIOS.values())
+    )
+    parser.add_argument("scenarios", nargs="+", choices=list(SCENARIOS), metavar="SCENARIO")
+    parser.add_argument("--url", help="Server to load, e.g. http://localhost:8000; the app runs in this process when omitted")
+    parser.add_argument("--mongo", choices=["memory", "local"], default="memory",
+                        help="In-process app only: in-memory MongoDB stand-in (default) or MONGO_DB_HOST/PORT")
+    parser.add_argument("--config", action="append", default=[], metavar="NAME:KEY=VALUE,...",
+                        help="In-process app configuration to run the scenarios with, e.g. nocache:IMAGE_CACHE_MAX_BYTES=0 "
+                             "or proposed:app=mymodule:app; repeat to compare configurations, the first is the reference")
+    parser.add_argument("--uploads", type=int, default=500, help="upload-burst: images uploaded at once")
+    parser.add_argument("--thumbnails", type=int, default=200, help="open-album: images in the album")
+    parser.add_argument("--albums", type=int, default=200, help="album-list: albums created before listing")
+    parser.add_argument("--pages", type=int, default=5, help="album-list: pages requested by each client")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent clients")
+    parser.add_argument("--connections", type=int, default=6, help="Concurrent requests of one client")
+    parser.add_argument("--image-mp", type=float, default=1, help="Size of the uploaded images in megapixels")
+    parser.add_argument("--batch-size", type=int, default=50, help="Images per batch upload while filling albums")
+    parser.add_argument("--poll-interval", type=float, default=0.25, help="Seconds between job status polls")
+    parser.add_argument("--sample-interval", type=float, default=0.2, help="Seconds between queue depth samples")
+    parser.add_argument("--max-connections", type=int, default=100, help="--url only: connection pool size")
+    parser.add_argument("--timeout", type=float, default=120, help="Request timeout in seconds")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Change flagged when comparing configurations")
+    parser.add_argument("--output", help="Write the results as JSON")
+    options = parser.parse_args()
+
+    # The app logs every rejected upload, keep its output to errors
+    logging.basicConfig(level=logging.ERROR, format="%(message)s")
+    logger.setLevel(logging.INFO)
+    results = asyncio.run(run(options))
+
+    names = list(results)
+    for name in names[1:]:
+        differences = report.compare(
+            as_comparable(results[name]), as_comparable(results[names[0]]), options.threshold, rate_key="requests_per_sec"
+        )
+        print(f"\n{name} against {names[0]}:")
+        print(report.format_comparison(differences))
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
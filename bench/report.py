@@ -0,0 +1,89 @@
+from typing import Optional
+import json, statistics
+
+PERCENTILES = (50, 95, 99)
+
+
+def summarize(samples: list[float]) -> dict:
+    """Count, mean, min, max and p50/p95/p99 of timings in seconds."""
+    if not samples:
+        return {"n": 0}
+
+    summary = {"n": len(samples), "mean": statistics.fmean(samples), "min": min(samples), "max": max(samples)}
+    if len(samples) == 1:
+        summary.update({f"p{q}": samples[0] for q in PERCENTILES})
+    else:
+        cuts = statistics.quantiles(samples, n=100, method="inclusive")
+        summary.update({f"p{q}": cuts[q - 1] for q in PERCENTILES})
+    return summary
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(results: dict, path: str):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.2, stage_thresholds: Optional[dict[str, float]] = None,
+            metric: str = "p50", min_delta: float = 0.001, rate_key: str = "images_per_sec") -> list[dict]:
+    """Differences between two benchmark results, each flagged as a regression or not.
+
+    A timing regresses when its `metric` grows by more than `threshold` (a
+    fraction, overridable per stage) and by more than `min_delta` seconds, which
+    keeps sub-millisecond noise out. A throughput regresses when it drops by more
+    than `threshold`; throughputs are read from their `rate_key`. Cases missing
+    from either side are skipped.
+    """
+    stage_thresholds = stage_thresholds or {}
+    differences = []
+
+    for case, stages in results.get("cases", {}).items():
+        for stage, summary in stages.items():
+            before = baseline.get("cases", {}).get(case, {}).get(stage, {}).get(metric)
+            after = summary.get(metric)
+            if not before or after is None:
+                continue
+            limit = stage_thresholds.get(stage, threshold)
+            change = after / before - 1
+            differences.append({
+                "case": case,
+                "stage": stage,
+                "baseline": before,
+                "current": after,
+                "change": change,
+                "regression": change > limit and after - before > min_delta
+            })
+
+    for name, current in results.get("throughput", {}).items():
+        before = baseline.get("throughput", {}).get(name, {}).get(rate_key)
+        after = current.get(rate_key)
+        if not before or after is None:
+            continue
+        limit = stage_thresholds.get(name, threshold)
+        change = after / before - 1
+        differences.append({
+            "case": name,
+            "stage": "throughput",
+            "baseline": before,
+            "current": after,
+            "change": change,
+            "regression": change < -limit
+        })
+
+    return differences
+
+
+def format_comparison(differences: list[dict]) -> str:
+    width = max([28] + [len(diff["case"]) for diff in differences])
+    lines = [f"{'case':<{width}} {'stage':<12} {'baseline':>10} {'current':>10} {'change':>8}"]
+    for diff in differences:
+        flag = "  REGRESSION" if diff["regression"] else ""
+        lines.append(
+            f"{diff['case']:<{width}} {diff['stage']:<12} {diff['baseline']:>10.4f} {diff['current']:>10.4f} "
+            f"{diff['change']:>+7.1%}{flag}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,160 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from gridfs.errors import NoFile
+from io import BytesIO
+from typing import Iterator, Optional
+from unittest import mock
+import core.mongo.mongo
+
+try:
+    from mongomock_motor import AsyncMongoMockClient
+except ImportError:
+    AsyncMongoMockClient = None
+
+CHUNK_SIZE = 255 * 1024
+
+
+class MemoryGridOut:
+    """The parts of an AsyncGridOut that ImageClient reads."""
+
+    def __init__(self, doc: dict, data: bytes):
+        self._id = doc["_id"]
+        self.filename = doc["filename"]
+        self.length = doc["length"]
+        self.metadata = doc.get("metadata")
+        self.upload_date = doc["uploadDate"]
+        self.buffer = BytesIO(data)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self.buffer.read(size)
+
+    async def readchunk(self) -> bytes:
+        return self.buffer.read(CHUNK_SIZE)
+
+    async def seek(self, position: int):
+        self.buffer.seek(position)
+
+    async def close(self):
+        pass
+
+
+class MemoryCursor:
+    def __init__(self, items: list):
+        self.items = items
+
+    async def to_list(self, length: Optional[int] = None) -> list:
+        return self.items[:length] if length else self.items
+
+
+class MemoryGridFSBucket:
+    """GridFS on top of the stand-in database, storing files and chunks in the usual collections.
+
+    Keeping the `<bucket>.files` documents real lets ImageClient query and
+    delete them directly, as it does against MongoDB.
+    """
+
+    def __init__(self, database, bucket_name: str = "fs"):
+        self.files = database.get_collection(f"{bucket_name}.files")
+        self.chunks = database.get_collection(f"{bucket_name}.chunks")
+
+    async def upload_from_stream_with_id(self, file_id, filename: str, source, metadata: Optional[dict] = None):
+        data = source.read()
+        await self.files.insert_one({
+            "_id": file_id,
+            "filename": filename,
+            "length": len(data),
+            "chunkSize": CHUNK_SIZE,
+            # The driver returns naive UTC datetimes
+            "uploadDate": datetime.now(timezone.utc).replace(tzinfo=None),
+            "metadata": metadata
+        })
+        if data:
+            await self.chunks.insert_many([
+                {"files_id": file_id, "n": n, "data": data[start:start + CHUNK_SIZE]}
+                for n, start in enumerate(range(0, len(data), CHUNK_SIZE))
+            ])
+
+    async def _grid_out(self, doc: dict) -> MemoryGridOut:
+        chunks = await self.chunks.find({"files_id": doc["_id"]}).sort("n", 1).to_list(None)
+        return MemoryGridOut(doc, b"".join(chunk["data"] for chunk in chunks))
+
+    async def open_download_stream(self, file_id) -> MemoryGridOut:
+        doc = await self.files.find_one({"_id": file_id})
+        if doc is None:
+            raise NoFile(f"no file in gridfs collection with _id {file_id!r}")
+        return await self._grid_out(doc)
+
+    def find(self, filter: dict) -> MemoryCursor:
+        outer = self
+
+        class Cursor(MemoryCursor):
+            async def to_list(self, length: Optional[int] = None) -> list:
+                docs = await outer.files.find(filter).to_list(length)
+                return [await outer._grid_out(doc) for doc in docs]
+
+        return Cursor([])
+
+    async def delete(self, file_id):
+        result = await self.files.delete_one({"_id": file_id})
+        await self.chunks.delete_many({"files_id": file_id})
+        if not result.deleted_count:
+            raise NoFile(f"no file could be deleted because none matched {file_id}")
+
+
+class MemoryCollection:
+    """Stand-in collection with the call signatures of PyMongo's async API, which mongomock-motor
+    follows Motor in: PyMongo's `aggregate` is a coroutine returning the cursor.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def aggregate(self, pipeline: list, *args, **kwargs):
+        return self.collection.aggregate(pipeline, *args, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self.collection, name)
+
+
+class MemoryDatabase:
+    def __init__(self, database):
+        self.database = database
+
+    def get_collection(self, name: str, *args, **kwargs) -> MemoryCollection:
+        return MemoryCollection(self.database.get_collection(name, *args, **kwargs))
+
+    async def create_collection(self, name: str, check_exists: bool = True, **kwargs):
+        # mongomock rejects the option, failing on existing collections is what it does anyway
+        return MemoryCollection(await self.database.create_collection(name, **kwargs))
+
+    def __getattr__(self, name: str):
+        return getattr(self.database, name)
+
+
+class MemoryMongoClient:
+    """Shared in-memory server for every BaseMongoClient, closed once by whoever opened it."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_database(self, name: str):
+        return MemoryDatabase(self.client.get_database(name))
+
+    async def close(self):
+        pass
+
+
+@contextmanager
+def memory_mongo() -> Iterator:
+    """Make every BaseMongoClient created inside the block use one in-memory database and GridFS.
+
+    Needs the mongomock-motor package. Albums, jobs, hashes and files behave as
+    with MongoDB for the queries this app makes, without a server to run.
+    """
+    if AsyncMongoMockClient is None:
+        raise RuntimeError("The in-memory MongoDB stand-in needs mongomock-motor: pip install mongomock-motor")
+
+    shared = MemoryMongoClient(AsyncMongoMockClient())
+    with mock.patch.object(core.mongo.mongo, "AsyncMongoClient", lambda uri, **kwargs: shared), \
+            mock.patch.object(core.mongo.mongo, "AsyncGridFSBucket", MemoryGridFSBucket):
+        yield shared.client
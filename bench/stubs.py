@@ -0,0 +1,27 @@
+from bson import ObjectId
+from typing import Optional
+import asyncio
+
+
+class StubImageClient:
+    """Stands in for ImageClient so the Converter runs without MongoDB.
+
+    Uploads are kept in memory, after `upload_latency` seconds to approximate a
+    GridFS round trip. Only the calls a conversion without content hash or album
+    makes are implemented.
+    """
+
+    def __init__(self, upload_latency: float = 0.0):
+        self.upload_latency = upload_latency
+        self.files: dict[str, bytes] = {}
+
+    async def uploadBytesToBucket(self, data: bytes, filename: str, file_id: Optional[ObjectId] = None,
+                                  metadata: Optional[dict] = None) -> str:
+        if self.upload_latency:
+            await asyncio.sleep(self.upload_latency)
+        file_id = str(file_id or ObjectId())
+        self.files[file_id] = data
+        return file_id
+
+    async def deleteFileFromBucket(self, file_id: str) -> bool:
+        return self.files.pop(file_id, None) is not None
@@ -1,6 +1,10 @@
+from bson import ObjectId
 from fastapi import Request
-from core.models.album import Album, AlbumCreateRequest, AlbumCreateResponse, AlbumGetRequest, AlbumDeleteRequest, AlbumOperationResult
-import logging
+from fastapi.responses import StreamingResponse
+from core.helper.converter import AlbumDeleteJob, Status
+from core.helper.events import open_event_stream
+from core.models.album import Album, AlbumCreateRequest, AlbumCreateResponse, AlbumGetRequest, AlbumDeleteRequest, AlbumDeleteResponse, AlbumListRequest, AlbumPage, AlbumContentRequest, AlbumContentPage
+import logging, time, uuid
 from typing import List, Optional
 
 logger = logging.getLogger(__name__)
@@ -42,6 +46,21 @@ async def get_album(album_data: AlbumGetRequest, request: Request) -> Optional[A
         logger.error(f"Get album failed: {e}")
         return None
 
+async def get_album_content(params: AlbumContentRequest, request: Request) -> Optional[AlbumContentPage]:
+    try:
+        album_client = request.app.state.album_client
+        page = await album_client.getAlbumContent(params.id, params.offset, params.limit)
+
+        if page is None:
+            logger.warning(f"Album not found")
+            return None
+
+        return page
+
+    except Exception as e:
+        logger.error(f"Get album content failed: {e}")
+        return None
+
 async def get_all_album(request: Request) -> Optional[List[Album]]:
     try:
         album_client = request.app.state.album_client
@@ -50,45 +69,98 @@ async def get_all_album(request: Request) -> Optional[List[Album]]:
     except Exception as e:
         return None
 
-async def delete_album(album_data: AlbumDeleteRequest, request: Request) -> AlbumOperationResult:
+async def delete_album(album_data: AlbumDeleteRequest, request: Request) -> AlbumDeleteResponse:
     logger.info(f"Delete album request - album_id={album_data.id}")
 
     try:
         album_client = request.app.state.album_client
-        image_client = request.app.state.image_client
+        converter = request.app.state.converter
 
         album = await album_client.getAlbumById(album_data.id)
         if album is None:
             logger.warning(f"Album not found")
-            return AlbumOperationResult(status=False, message=f"Album not found")
-
-        print(len(album.content))
-
-        failed_deletions = []
-        for image_pair in album.content:
-            main_deleted = await image_client.deleteFileFromBucket(image_pair.image_id)
-            if not main_deleted:
-                failed_deletions.append(f"main:{image_pair.image_id}")
+            return AlbumDeleteResponse(status=False, message=f"Album not found")
+
+        # The album disappears right away and its files follow in the background. The pending
+        # deletion, recorded first, lets the next startup finish if the process dies in between.
+        if not await album_client.addPendingDeletion(album.id, album.content):
+            return AlbumDeleteResponse(status=False, message=f"Album is already being deleted")
+
+        try:
+            content = await album_client.deleteAlbumById(album.id)
+        except Exception:
+            # Once the album is gone the pending deletion stays, for the next startup to finish
+            if await album_client.albumExists(album.id):
+                await album_client.removePendingDeletion(album.id)
+            raise
+        if content is None:
+            await album_client.removePendingDeletion(album.id)
+            return AlbumDeleteResponse(status=False, message=f"Failed to delete album")
+
+        # Images may have been added since the album was read
+        await album_client.setPendingDeletionContent(album.id, content)
+        job = await _start_album_deletion(album.id, len(content), album_client, request.app.state.image_client, converter)
 
-            thumb_deleted = await image_client.deleteFileFromBucket(image_pair.thumbnail_id)
-            if not thumb_deleted:
-                failed_deletions.append(f"thumb:{image_pair.thumbnail_id}")
+        logger.info(f"Album deleted success:{album_data.id}")
+        return AlbumDeleteResponse(status=True, message=f"Album deleted, removing {len(content)} images", job_id=job.id)
 
-        if failed_deletions:
-            error_msg = f"Failed to delete some images: {', '.join(failed_deletions)}"
-            return AlbumOperationResult(status=False, message=error_msg)
+    except Exception as e:
+        logger.error(f"Delete album failed: {e}")
+        return AlbumDeleteResponse(status=False, message=f"Delete album failed: {str(e)}")
+
+async def resume_album_deletions(album_client, image_client, converter) -> int:
+    """Restart the file deletion of albums deleted before the last shutdown or crash"""
+    album_ids = await album_client.getPendingDeletions()
+    for album_id in album_ids:
+        await _start_album_deletion(album_id, 0, album_client, image_client, converter)
+    if album_ids:
+        logger.info(f"Resumed the file deletion of {len(album_ids)} deleted albums")
+    return len(album_ids)
+
+async def _start_album_deletion(album_id: str, image_count: int, album_client, image_client, converter) -> AlbumDeleteJob:
+    job = AlbumDeleteJob(id=f"delete_{album_id}_{uuid.uuid4().hex[:8]}_job", album_id=album_id, total_files=2 * image_count)
+    await converter.run_background(job, _delete_album_files(job, album_client, image_client, converter))
+    return job
+
+async def _delete_album_files(job: AlbumDeleteJob, album_client, image_client, converter):
+    async def on_progress(deleted: int, total: int):
+        # The total includes renditions, which only the image client looks up
+        job.deleted_files, job.total_files = deleted, total
+        await converter.save_progress(job)
 
-        # 3. Delete album from MongoDB
-        result = await album_client.deleteAlbumByName(album.name)
-        if not result.status:
-            return AlbumOperationResult(status=False, message=f"Failed to delete album")
+    try:
+        content = await album_client.claimPendingRelease(job.album_id)
+        if content is not None:
+            # Images shared with another album through a re-upload keep their files
+            unreferenced = set(await image_client.releaseImages([pair.image_id for pair in content]))
+            file_ids = [file_id for pair in content if pair.image_id in unreferenced for file_id in (pair.image_id, pair.thumbnail_id)]
+            await album_client.setPendingDeletionFiles(job.album_id, file_ids)
+        else:
+            # Released by an earlier run, which recorded the files left to delete
+            file_ids = await album_client.getPendingDeletionFiles(job.album_id)
+        job.total_files = len(file_ids)
+
+        await image_client.deleteFilesFromBucket(file_ids, on_progress=on_progress)
+        await album_client.removePendingDeletion(job.album_id)
+        job.state = Status.SUCCESS
+    except Exception as e:
+        # The pending deletion stays, the next startup tries again
+        logger.error(f"Delete album images failed: {e}")
+        job.state = Status.FAILED
+        job.error_message = str(e)
+    job.completed_at = time.time()
+
+async def stream_album_events(album_id: str, request: Request) -> Optional[StreamingResponse]:
+    """Events of every upload, batch and deletion of an album, until the client disconnects"""
+    try:
+        if not ObjectId.is_valid(album_id) or not await request.app.state.album_client.albumExists(album_id):
+            return None
 
-        logger.info(f"Album deleted success:{album_data.id}")
-        return AlbumOperationResult(status=True, message=f"Album and images deleted successfully")
+        return await open_event_stream(request.app.state.converter.events, f"album:{album_id}")
 
     except Exception as e:
-        logger.error(f"Delete album failed: {e}")
-        return AlbumOperationResult(status=False, message=f"Delete album failed: {str(e)}")
+        logger.error(f"Album event stream failed: {e}")
+        return None
 
 async def get_all_albums(request: Request) -> list[Album]:
     try:
@@ -100,4 +172,14 @@ async def get_all_albums(request: Request) -> list[Album]:
 
     except Exception as e:
         logger.error(f"Get all albums failed: {e}")
-        return []
\ No newline at end of file
+        return []
+
+async def list_albums(params: AlbumListRequest, request: Request) -> Optional[AlbumPage]:
+    try:
+        album_client = request.app.state.album_client
+
+        return await album_client.listAlbums(params.limit, params.cursor)
+
+    except Exception as e:
+        logger.error(f"List albums failed: {e}")
+        return None
@@ -1,35 +1,77 @@
-from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
+from dataclasses import dataclass
 from enum import Enum
-from typing import Optional
-from pydantic import BaseModel
-import os, threading, uuid, asyncio, logging, time
-from PIL import Image
+from typing import Any, BinaryIO, ClassVar, Coroutine, Optional, Union
+import os, uuid, asyncio, logging, time
+from core.helper import metrics
+from core.helper.engine import ConversionEngine, ThreadEngine
+from core.helper.job_queue import FairJobQueue
+from core.helper.events import EventBroker, record_event
+from core.helper.job_store import InMemoryJobStore, JobStore
+from core.helper.render import EncoderProfile, PROFILES, render_renditions
+from core.models.album import ImagePair
 
 logger = logging.getLogger(__name__)
 
+# Background jobs report progress far more often than the job store needs to see it
+PROGRESS_SAVE_SECONDS = 0.25
+
 class Status(Enum):
     SUCCESS = 0
     FAILED = 1
     PROCESS = 2
+    # Groups only: some jobs failed, the others were added to the album
+    PARTIAL = 3
+
+# Job records are plain slotted dataclasses rather than Pydantic models: the job
+# table holds one per upload for the whole TTL, so per-instance size matters.
 
-class ImageStatus(BaseModel):
+@dataclass(slots=True)
+class ImageStatus:
     status: Status
     gridfs_id: Optional[str] = None
     error_message: Optional[str] = None
     completed_at: Optional[float] = None
 
-class AlbumAssociationStatus(BaseModel):
+    @classmethod
+    def from_dict(cls, data: dict) -> "ImageStatus":
+        return cls(Status(data["status"]), data.get("gridfs_id"), data.get("error_message"), data.get("completed_at"))
+
+@dataclass(slots=True)
+class AlbumAssociationStatus:
     associated: bool = False
     error_message: Optional[str] = None
 
-class Job(BaseModel):
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> Optional["AlbumAssociationStatus"]:
+        return cls(data["associated"], data.get("error_message")) if data else None
+
+@dataclass(slots=True)
+class Job:
+    event_kind: ClassVar[str] = "job"
+
     id: str
     src: str
-    dist: str
-    thumbnail_dist: str
     main_image: ImageStatus
     thumbnail: ImageStatus
+    album_id: Optional[str] = None
     album_association: Optional[AlbumAssociationStatus] = None
+    group_id: Optional[str] = None
+    # The upload matched the content hash of an earlier one and reuses its files
+    deduplicated: bool = False
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Job":
+        return cls(
+            id=data["id"],
+            src=data["src"],
+            main_image=ImageStatus.from_dict(data["main_image"]),
+            thumbnail=ImageStatus.from_dict(data["thumbnail"]),
+            album_id=data.get("album_id"),
+            album_association=AlbumAssociationStatus.from_dict(data.get("album_association")),
+            group_id=data.get("group_id"),
+            deduplicated=data.get("deduplicated", False)
+        )
 
     @property
     def status(self) -> Status:
@@ -46,202 +88,566 @@ class Job(BaseModel):
             return max(self.main_image.completed_at, self.thumbnail.completed_at)
         return None
 
-class Converter:
-    def __init__(self, image_client=None, job_ttl_seconds: int = 3600, main_event_loop=None):
-        self.temp_dir = "/tmp/image_converter"
-        os.makedirs(self.temp_dir, exist_ok=True)
-
-        self.main_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="main_img")
-        self.thumb_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="thumbnail")
-
-        self.jobs = {}
-        self.thread_lock = threading.Lock()
-        self.image_client = image_client
-        self.job_ttl_seconds = job_ttl_seconds
-        self.main_event_loop = main_event_loop
-
-    def submit(self, src_path: str, filename: str, album_id: Optional[str] = None, album_client=None) -> str:
-        
-        base_filename = os.path.splitext(filename)[0]
-        
-        safe_filename = "".join(c if c.isalnum() or c in ('-', '_') else '_' for c in base_filename)
-        job_id = f"{safe_filename}_{uuid.uuid4().hex[:8]}_job"
+    @property
+    def finished(self) -> bool:
+        # Group jobs are added to the album by their group
+        if self.status == Status.SUCCESS:
+            return self.album_association is not None or not self.album_id or self.group_id is not None
+        return self.status == Status.FAILED
+
+    def topics(self) -> list[str]:
+        topics = [f"job:{self.id}"]
+        if self.group_id:
+            topics.append(f"group:{self.group_id}")
+        if self.album_id:
+            topics.append(f"album:{self.album_id}")
+        return topics
+
+    def to_response(self) -> dict:
+        return {
+            "job_id": self.id,
+            "overall_status": self.status.name,
+            "deduplicated": self.deduplicated,
+            "main_image": {
+                "status": self.main_image.status.name,
+                "gridfs_id": self.main_image.gridfs_id,
+                "error_message": self.main_image.error_message
+            },
+            "thumbnail": {
+                "status": self.thumbnail.status.name,
+                "gridfs_id": self.thumbnail.gridfs_id,
+                "error_message": self.thumbnail.error_message
+            },
+            "album_association": {
+                "associated": self.album_association.associated,
+                "error_message": self.album_association.error_message
+            } if self.album_association else None
+        }
+
+@dataclass(slots=True)
+class AlbumDeleteJob:
+    event_kind: ClassVar[str] = "album_delete"
 
-        dist_path = os.path.join(self.temp_dir, f"{job_id}.webp")
-        thumbnail_path = os.path.join(self.temp_dir, f"{job_id}_thumb.webp")
+    id: str
+    album_id: str
+    total_files: int = 0
+    deleted_files: int = 0
+    state: Status = Status.PROCESS
+    error_message: Optional[str] = None
+    completed_at: Optional[float] = None
 
-        job = Job(
-            id=job_id,
-            src=src_path,
-            dist=dist_path,
-            thumbnail_dist=thumbnail_path,
-            main_image=ImageStatus(status=Status.PROCESS),
-            thumbnail=ImageStatus(status=Status.PROCESS)
-        )
+    @classmethod
+    def from_dict(cls, data: dict) -> "AlbumDeleteJob":
+        return cls(**{**data, "state": Status(data["state"])})
 
-        with self.thread_lock:
-            self.jobs[job_id] = job
+    @property
+    def status(self) -> Status:
+        return self.state
 
-        def _process_main():
-            start_time = time.time()
-            try:
-                logger.info("Thread started")
+    @property
+    def finished(self) -> bool:
+        return self.completed_at is not None
+
+    def topics(self) -> list[str]:
+        return [f"job:{self.id}", f"album:{self.album_id}"]
+
+    def to_response(self) -> dict:
+        return {
+            "job_id": self.id,
+            "overall_status": self.status.name,
+            "album_id": self.album_id,
+            "progress": {
+                "total_files": self.total_files,
+                "deleted_files": self.deleted_files
+            },
+            "error_message": self.error_message
+        }
+
+@dataclass(slots=True)
+class JobGroup:
+    """Jobs of one batch upload, associated with the album together once all of them finish.
+
+    The group FAILED when no job converted or the album update failed, and is
+    PARTIAL when the converted jobs were added but others failed.
+    """
+    event_kind: ClassVar[str] = "group"
 
-                img = Image.open(src_path)
+    id: str
+    album_id: str
+    job_ids: list[str]
+    pending: int
+    album_association: Optional[AlbumAssociationStatus] = None
+    completed_at: Optional[float] = None
+    # Jobs converted and jobs failed, counted once the last job finishes
+    succeeded: Optional[int] = None
+    failed: Optional[int] = None
 
-                img = self._convert_color_type(img)
+    @classmethod
+    def from_dict(cls, data: dict) -> "JobGroup":
+        return cls(**{**data, "album_association": AlbumAssociationStatus.from_dict(data.get("album_association"))})
 
-                main_img = img.copy()
-                main_img.thumbnail((1920, 1080), Image.Resampling.LANCZOS)
+    @property
+    def status(self) -> Status:
+        if self.completed_at is None:
+            return Status.PROCESS
+        if self.succeeded == 0 or (self.album_association and not self.album_association.associated):
+            return Status.FAILED
+        if self.failed:
+            return Status.PARTIAL
+        return Status.SUCCESS
 
-                main_img.save(dist_path, 'WEBP', quality=100)
+    @property
+    def finished(self) -> bool:
+        return self.completed_at is not None
+
+    def topics(self) -> list[str]:
+        return [f"group:{self.id}", f"album:{self.album_id}"]
+
+    def to_response(self, jobs: Optional[list[Job]] = None) -> dict:
+        """Aggregate status; per-job counts and ids are included when the group's `jobs` are given."""
+        response = {
+            "group_id": self.id,
+            "album_id": self.album_id,
+            "overall_status": self.status.name,
+            "progress": {
+                "total": len(self.job_ids),
+                "pending": self.pending
+            },
+            "album_association": {
+                "associated": self.album_association.associated,
+                "error_message": self.album_association.error_message
+            } if self.album_association else None
+        }
+        if jobs is not None:
+            response["progress"].update({
+                "succeeded": sum(job.status == Status.SUCCESS for job in jobs),
+                "failed": sum(job.status == Status.FAILED for job in jobs),
+                "processing": sum(job.status == Status.PROCESS for job in jobs)
+            })
+            response["jobs"] = [
+                {
+                    "job_id": job.id,
+                    "status": job.status.name,
+                    "main_image_id": job.main_image.gridfs_id,
+                    "thumbnail_id": job.thumbnail.gridfs_id
+                }
+                for job in jobs
+            ]
+        return response
 
-                if self.image_client and self.main_event_loop:
-                    logger.info("Starting GridFS upload")
-                    future = asyncio.run_coroutine_threadsafe(
-                        self.image_client.uploadFileToBucket(dist_path, f"{filename}.webp"),
-                        self.main_event_loop
-                    )
-                    main_id = future.result()
-                    job.main_image.gridfs_id = main_id
+class Converter:
+    def __init__(self, image_client=None, job_ttl_seconds: int = 3600, engine: Optional[ConversionEngine] = None,
+                 max_queue_depth: int = 256, concurrency: Optional[int] = None, job_store: Optional[JobStore] = None,
+                 expected_service_seconds: float = 2.0, main_profile: EncoderProfile = PROFILES["webp"], thumbnail_profile: EncoderProfile = PROFILES["webp"]):
+        # Decoding and encoding run on the engine, everything else is awaited on the event loop
+        self.engine = engine or ThreadEngine()
+
+        # Stored files are served to every client, AVIF is only ever a negotiated rendition
+        if main_profile.format != "WEBP" or thumbnail_profile.format != "WEBP":
+            raise ValueError("Main image and thumbnail profiles must encode WebP")
+        self.main_profile = main_profile
+        self.thumbnail_profile = thumbnail_profile
+
+        self.job_store = job_store or InMemoryJobStore()
+        # State changes are published here as they are saved, for event streams
+        self.events = EventBroker()
+        # Groups with jobs still queued or running in this process, with their album client
+        self.active_groups: dict[str, tuple[JobGroup, list[Job], Any]] = {}
+        self.image_client = image_client
+        self.job_ttl_seconds = job_ttl_seconds
 
-                job.main_image.status = Status.SUCCESS
-                job.main_image.completed_at = time.time()
+        # Twice the engine size by default so uploads of finished jobs overlap with rendering
+        self.concurrency = concurrency or self.engine.max_workers * 2
+        self.queue = FairJobQueue(max_depth=max_queue_depth, concurrency=self.concurrency,
+                                  expected_service_seconds=expected_service_seconds)
+        self.workers: list[asyncio.Task] = []
+        # Strong references to background jobs (e.g. album deletion) run outside the queue
+        self.background_tasks: set[asyncio.Task] = set()
+        self.progress_saved_at: dict[str, float] = {}
+        self.sweeper: Optional[asyncio.Task] = None
+
+    async def submit(self, source: BinaryIO, filename: str, album_id: Optional[str] = None, album_client=None,
+                     content_hash: Optional[str] = None) -> str:
+        """Queue the conversion of `source`, a readable binary file positioned at the start.
+
+        Must be called from the event loop. Raises QueueFullError when the queue is at
+        capacity, otherwise the Converter takes ownership of `source` and closes it once
+        it has been decoded. With a `content_hash`, a source already converted by an
+        earlier upload reuses its files instead of being converted again.
+        """
+        job = self._create_job(filename, album_id)
+
+        self._start_workers()
+        self.queue.put_nowait(album_id, (job, source, filename, album_id, album_client, content_hash))
+        await self._save(job)
+
+        return job.id
+
+    async def submit_existing(self, image_pair: ImagePair, filename: str, album_id: Optional[str] = None, album_client=None) -> str:
+        """Create a job for an upload whose content was already converted, only adding it to the album."""
+        job = self._create_job(filename, album_id)
+        self._use_existing(job, image_pair)
+
+        if album_id and album_client:
+            await self.run_background(job, self._associate(job, album_id, album_client))
+        else:
+            await self._save(job)
+
+        return job.id
+
+    async def submit_batch(self, sources: list[tuple[BinaryIO, str, Optional[str]]], album_id: str, album_client) -> JobGroup:
+        """Queue (source, filename, content_hash) entries as one job group.
+
+        The batch is admitted as a whole or rejected with QueueFullError, or with
+        BatchTooLargeError when it has more entries than the queue holds. Instead of one
+        album update per image, the group adds every converted image to the album with
+        a single update once its last job finishes.
+        """
+        self.queue.check_capacity(len(sources))
+
+        group_id = f"group_{uuid.uuid4().hex[:12]}"
+        jobs = [self._create_job(filename, album_id, group_id) for _, filename, _ in sources]
+        group = JobGroup(
+            id=group_id,
+            album_id=album_id,
+            job_ids=[job.id for job in jobs],
+            pending=len(jobs)
+        )
 
-            except Exception as e:
-                job.main_image.status = Status.FAILED
-                job.main_image.error_message = str(e)
-                job.main_image.completed_at = time.time()
+        self.active_groups[group_id] = (group, jobs, album_client)
 
-            finally:
-                try:
-                    if os.path.exists(dist_path):
-                        os.remove(dist_path)
-                except Exception as e:
-                    logger.error("Clean up failed")
+        self._start_workers()
+        for job, (source, filename, content_hash) in zip(jobs, sources):
+            # No album client per job: the group does the association
+            self.queue.put_nowait(album_id, (job, source, filename, album_id, None, content_hash))
 
-        def _process_thumbnail():
-            try:
-                img = Image.open(src_path)
-                
-                img = self._convert_color_type(img)
-
-                thumb_img = img.copy()
-                thumb_img.thumbnail((512, 512), Image.Resampling.LANCZOS)
-                
-                thumb_final = Image.new('RGB', (512, 512), (255, 255, 255))
-                paste_x = (512 - thumb_img.width) // 2
-                paste_y = (512 - thumb_img.height) // 2
-
-                if thumb_img.width > 512 or thumb_img.height > 512:
-                    left = (thumb_img.width - 512) // 2
-                    top = (thumb_img.height - 512) // 2
-                    thumb_img = thumb_img.crop((left, top, left + 512, top + 512))
-                    paste_x = 0
-                    paste_y = 0
-
-                thumb_final.paste(thumb_img, (paste_x, paste_y))
-
-                thumb_final.save(thumbnail_path, 'WEBP', quality=100)
-
-                if self.image_client and self.main_event_loop:
-                    while job.main_image.gridfs_id is None and job.main_image.status == Status.PROCESS:
-                        time.sleep(0.1)  # poll in every 100ms
-
-                    if job.main_image.gridfs_id:
-                        future = asyncio.run_coroutine_threadsafe(
-                            self.image_client.uploadFileToBucket(thumbnail_path, f"thumbnail_{job.main_image.gridfs_id}.webp"),
-                            self.main_event_loop
-                        )
-                        thumb_id = future.result()
-                        job.thumbnail.gridfs_id = thumb_id
-                    else:
-                        raise Exception("Main image processing failed.")
-
-                job.thumbnail.status = Status.SUCCESS
-                job.thumbnail.completed_at = time.time()
+        await asyncio.gather(self._save(group), *(self._save(job) for job in jobs))
+        return group
 
-            except Exception as e:
-                job.thumbnail.status = Status.FAILED
-                job.thumbnail.error_message = str(e)
-                job.thumbnail.completed_at = time.time()
+    def _create_job(self, filename: str, album_id: Optional[str] = None, group_id: Optional[str] = None) -> Job:
+        base_filename = os.path.splitext(filename)[0]
+        
+        safe_filename = "".join(c if c.isalnum() or c in ('-', '_') else '_' for c in base_filename)
+        job_id = f"{safe_filename}_{uuid.uuid4().hex[:8]}_job"
 
-            finally:
-                try:
-                    if os.path.exists(thumbnail_path):
-                        os.remove(thumbnail_path)
-                except Exception as e:
-                    logger.info(f"Failed to clean up temp file: {e}")
+        return Job(
+            id=job_id,
+            src=filename,
+            main_image=ImageStatus(status=Status.PROCESS),
+            thumbnail=ImageStatus(status=Status.PROCESS),
+            album_id=album_id,
+            group_id=group_id
+        )
 
-        def _cleanup_source():
+    def check_capacity(self, count: int = 1):
+        """Raise QueueFullError early, before uploads are hashed, if they would be rejected."""
+        self.queue.check_capacity(count)
 
-            main_future = self.main_executor.submit(_process_main)
-            thumb_future = self.thumb_executor.submit(_process_thumbnail)
+    def queue_stats(self) -> dict:
+        return self.queue.stats()
 
-            main_future.result()
-            thumb_future.result()
+    def _start_workers(self):
+        if self.workers:
+            return
+        loop = asyncio.get_running_loop()
+        self.workers = [loop.create_task(self._worker()) for _ in range(self.concurrency)]
 
-            if album_id and album_client and job.main_image.gridfs_id and job.thumbnail.gridfs_id and self.main_event_loop:
+    async def _worker(self):
+        while True:
+            entry = await self.queue.get()
+            start_time = time.monotonic()
+            job = entry[0]
+            try:
                 try:
-                    future = asyncio.run_coroutine_threadsafe(
-                        album_client.addImageToAlbum(album_id, job.main_image.gridfs_id, job.thumbnail.gridfs_id),
-                        self.main_event_loop
-                    )
-                    result = future.result()
-
-                    if result.status:
-                        job.album_association = AlbumAssociationStatus(associated=True)
-                    else:
-                        job.album_association = AlbumAssociationStatus(associated=False, error_message=result.message)
+                    await self._run_job(*entry)
                 except Exception as e:
-                    job.album_association = AlbumAssociationStatus(associated=False, error_message=str(e))
-
+                    logger.error(f"Conversion job crashed: {e}")
+                # A crashed job still counts towards its group, or the group would never finish
+                if job.group_id:
+                    await self._finish_group_job(job)
+            except Exception as e:
+                logger.error(f"Job group {job.group_id} failed to finish: {e}")
+            finally:
+                service_seconds = time.monotonic() - start_time
+                self.queue.task_done(service_seconds)
+                metrics.CONVERSION_STAGE_SECONDS.labels("total").observe(service_seconds)
+                metrics.CONVERSION_JOBS.labels(job.status.name).inc()
+
+    async def _run_job(self, job: Job, source: BinaryIO, filename: str, album_id: Optional[str], album_client,
+                       content_hash: Optional[str] = None):
+        # Checked again here: the same content may have been converted while this job was queued.
+        # A job with a content hash holds a reference to its files until it is added to the album.
+        existing = await self._retain_duplicate(content_hash)
+        if existing:
+            source.close()
+            self._use_existing(job, existing)
+        else:
+            await self._convert(job, source, filename)
+            if content_hash and job.status == Status.SUCCESS:
+                await self._register_hash(job, content_hash)
+
+        if album_id and album_client and job.status == Status.SUCCESS:
+            await self._associate(job, album_id, album_client)
+
+        await self._save(job)
+
+    async def _convert(self, job: Job, source: BinaryIO, filename: str):
+        try:
+            # Worker processes cannot share the open file, they receive its contents instead
+            src = source if self.engine.shares_memory else await asyncio.to_thread(source.read)
+            # Both renditions come from a single decode of the source
+            start_time = time.perf_counter()
+            main_bytes, thumb_bytes, timings = await asyncio.wrap_future(self.engine.submit(render_renditions, src, self.main_profile, self.thumbnail_profile))
+            self._observe_render(timings, time.perf_counter() - start_time)
+        except Exception as e:
+            for image_status in (job.main_image, job.thumbnail):
+                self._set_failed(image_status, e)
+            return
+        finally:
+            source.close()
+
+        if self.image_client:
+            # Allocating the main id up front lets the thumbnail be named after it
+            # without waiting for the main upload to finish.
+            main_id = ObjectId()
+            start_time = time.perf_counter()
+            await asyncio.gather(
+                self._upload(job.main_image, main_bytes, f"{filename}.webp", main_id),
+                self._upload(job.thumbnail, thumb_bytes, f"thumbnail_{main_id}.webp")
+            )
+            metrics.CONVERSION_STAGE_SECONDS.labels("upload").observe(time.perf_counter() - start_time)
+            await self._discard_partial_upload(job)
+        else:
+            for image_status in (job.main_image, job.thumbnail):
+                self._set_success(image_status)
+
+    def _observe_render(self, timings: dict[str, float], elapsed: float):
+        for stage, seconds in timings.items():
+            metrics.CONVERSION_STAGE_SECONDS.labels(stage).observe(seconds)
+        # Whatever the render itself does not account for was spent waiting for a
+        # worker, or sending the source and results to a worker process
+        metrics.CONVERSION_STAGE_SECONDS.labels("engine_wait").observe(max(0.0, elapsed - sum(timings.values())))
+
+    async def _associate(self, job: Job, album_id: str, album_client):
+        try:
+            start_time = time.perf_counter()
+            result = await album_client.addImageToAlbum(album_id, job.main_image.gridfs_id, job.thumbnail.gridfs_id)
+            metrics.CONVERSION_STAGE_SECONDS.labels("album").observe(time.perf_counter() - start_time)
+
+            if result.status:
+                job.album_association = AlbumAssociationStatus(associated=True)
+            else:
+                job.album_association = AlbumAssociationStatus(associated=False, error_message=result.message)
+        except Exception as e:
+            job.album_association = AlbumAssociationStatus(associated=False, error_message=str(e))
+
+        if not job.album_association.associated:
+            await self._release(job)
+
+    async def _retain_duplicate(self, content_hash: Optional[str]) -> Optional[ImagePair]:
+        if not content_hash or not self.image_client:
+            return None
+        try:
+            return await self.image_client.retainImageByHash(content_hash)
+        except Exception as e:
+            # Deduplication is only an optimization, convert the upload instead
+            logger.warning(f"Content hash lookup failed: {e}")
+            return None
+
+    async def _register_hash(self, job: Job, content_hash: str):
+        try:
+            image_pair = await self.image_client.registerImageHash(content_hash, job.main_image.gridfs_id, job.thumbnail.gridfs_id)
+        except Exception as e:
+            logger.warning(f"Failed to register content hash: {e}")
+            return
+
+        if image_pair.image_id != job.main_image.gridfs_id:
+            # A concurrent upload of the same content registered first, keep its files
+            for image_status in (job.main_image, job.thumbnail):
+                await self.image_client.deleteFileFromBucket(image_status.gridfs_id)
+            self._use_existing(job, image_pair)
+
+    def _use_existing(self, job: Job, image_pair: ImagePair):
+        job.main_image.gridfs_id = image_pair.image_id
+        job.thumbnail.gridfs_id = image_pair.thumbnail_id
+        for image_status in (job.main_image, job.thumbnail):
+            self._set_success(image_status)
+        job.deduplicated = True
+
+    async def _release(self, job: Job):
+        """Give back the reference of a job whose image did not make it into the album.
+
+        The files are deleted when no album or other upload uses them anymore.
+        """
+        if not self.image_client:
+            return
+        image_id = job.main_image.gridfs_id
+        try:
+            if image_id not in await self.image_client.releaseImages([image_id]):
+                return
+            for image_status in (job.main_image, job.thumbnail):
+                await self.image_client.deleteFileFromBucket(image_status.gridfs_id)
+        except Exception as e:
+            logger.error(f"Failed to release image {image_id}: {e}")
+
+    async def _finish_group_job(self, job: Job):
+        if job.group_id not in self.active_groups:
+            return
+        group, jobs, album_client = self.active_groups[job.group_id]
+        group.pending -= 1
+        if group.pending:
+            return
+        del self.active_groups[group.id]
+
+        converted = [job for job in jobs if job.status == Status.SUCCESS]
+        group.succeeded, group.failed = len(converted), len(jobs) - len(converted)
+        if converted and album_client:
+            converted = await self._skip_duplicates(group, converted, album_client)
+
+        if converted and album_client:
+            pairs = [(job.main_image.gridfs_id, job.thumbnail.gridfs_id) for job in converted]
+            try:
+                start_time = time.perf_counter()
+                result = await album_client.addImagesToAlbum(group.album_id, pairs)
+                metrics.CONVERSION_STAGE_SECONDS.labels("album").observe(time.perf_counter() - start_time)
+                association = AlbumAssociationStatus(associated=result.status, error_message=None if result.status else result.message)
+            except Exception as e:
+                association = AlbumAssociationStatus(associated=False, error_message=str(e))
+
+            if not association.associated:
+                for job in converted:
+                    await self._release(job)
+
+            group.album_association = association
+            for job in converted:
+                job.album_association = association
+
+        group.completed_at = time.time()
+        await asyncio.gather(self._save(group), *(self._save(job) for job in jobs))
+
+    async def _skip_duplicates(self, group: JobGroup, jobs: list[Job], album_client) -> list[Job]:
+        """Drop jobs whose image is earlier in the batch, or deduplicated ones already in the album.
+
+        Which of two uploads of the same content registered it depends on timing, so
+        the later duplicate in the batch may be the one that was not deduplicated.
+        """
+        seen = set()
+        remaining = []
+        for job in jobs:
+            image_id = job.main_image.gridfs_id
+            if image_id in seen or (job.deduplicated and await album_client.getImagePair(group.album_id, image_id)):
+                job.album_association = AlbumAssociationStatus(associated=False, error_message="Image already in album.")
+                await self._release(job)
+                continue
+            seen.add(image_id)
+            remaining.append(job)
+        return remaining
+
+    async def _upload(self, image_status: ImageStatus, data: bytes, filename: str, file_id: Optional[ObjectId] = None):
+        try:
+            image_status.gridfs_id = await self.image_client.uploadBytesToBucket(data, filename, file_id)
+            self._set_success(image_status)
+        except Exception as e:
+            self._set_failed(image_status, e)
+
+    async def _discard_partial_upload(self, job: Job):
+        # A job is only usable with both files, don't leave a lone one behind in GridFS
+        if job.status != Status.FAILED:
+            return
+        for image_status in (job.main_image, job.thumbnail):
+            if image_status.gridfs_id:
+                await self.image_client.deleteFileFromBucket(image_status.gridfs_id)
+                image_status.gridfs_id = None
+
+    def _set_success(self, image_status: ImageStatus):
+        image_status.status = Status.SUCCESS
+        image_status.completed_at = time.time()
+
+    def _set_failed(self, image_status: ImageStatus, error: Exception):
+        image_status.status = Status.FAILED
+        image_status.error_message = str(error)
+        image_status.completed_at = time.time()
+
+    async def run_background(self, job: Union[Job, AlbumDeleteJob], coroutine: Coroutine):
+        """Track `job` in the job store and run `coroutine` for it on the event loop.
+
+        The job is saved again once `coroutine` returns. `coroutine` reports progress
+        made in between through `save_progress`.
+        """
+        await self._save(job)
+
+        task = asyncio.get_running_loop().create_task(self._run_background(job, coroutine))
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    async def _run_background(self, job: Union[Job, AlbumDeleteJob], coroutine: Coroutine):
+        try:
+            await coroutine
+        finally:
+            self.progress_saved_at.pop(job.id, None)
+            await self._save(job)
+
+    async def save_progress(self, job: Union[Job, AlbumDeleteJob]):
+        """Publish the progress of a background job, saving it at most every PROGRESS_SAVE_SECONDS.
+
+        Streams of this process get every update; readers of a shared job store,
+        such as other workers, see it a few times a second.
+        """
+        now = time.monotonic()
+        if now - self.progress_saved_at.get(job.id, 0.0) < PROGRESS_SAVE_SECONDS:
+            self.events.publish(job.topics(), record_event(job))
+            return
+        self.progress_saved_at[job.id] = now
+        await self._save(job)
+
+    async def _save(self, record: Union[Job, AlbumDeleteJob, JobGroup]):
+        self.events.publish(record.topics(), record_event(record))
+        try:
+            await self.job_store.save(record)
+        except Exception as e:
+            logger.error(f"Failed to save job {record.id}: {e}")
+
+    async def getJob(self, job_id: str) -> Optional[Union[Job, AlbumDeleteJob]]:
+        record = await self.job_store.get(job_id)
+        return None if isinstance(record, JobGroup) else record
+
+    async def getGroup(self, group_id: str) -> Optional[JobGroup]:
+        record = await self.job_store.get(group_id)
+        return record if isinstance(record, JobGroup) else None
+
+    async def getGroupJobs(self, group: JobGroup) -> list[Job]:
+        return await self.job_store.get_many(group.job_ids)
+
+    async def cleanup_old_jobs(self, max_jobs: Optional[int] = None) -> int:
+        return await self.job_store.cleanup(self.job_ttl_seconds, max_jobs)
+
+    def start_sweeper(self, interval_seconds: float, max_jobs: Optional[int] = None):
+        """Periodically drop expired jobs, and the oldest finished ones beyond `max_jobs`."""
+        if self.sweeper is None:
+            self.sweeper = asyncio.get_running_loop().create_task(self._sweep(interval_seconds, max_jobs))
+
+    async def _sweep(self, interval_seconds: float, max_jobs: Optional[int]):
+        while True:
+            await asyncio.sleep(interval_seconds)
             try:
-                if os.path.exists(src_path):
-                    os.remove(src_path)
+                removed = await self.cleanup_old_jobs(max_jobs)
+                if removed:
+                    logger.info(f"Removed {removed} finished jobs")
             except Exception as e:
-                logger.warning(f"Failed to clean up source file: {e}")
-
-        ThreadPoolExecutor(max_workers=1).submit(_cleanup_source)
-
-        return job_id
-
-    def getJob(self, job_id: str) -> Optional[Job]:
-        with self.thread_lock:
-            return self.jobs.get(job_id)
-
-    def cleanup_old_jobs(self):
-        current_time = time.time()
-        with self.thread_lock:
-            jobs_to_remove = []
-            for job_id, job in self.jobs.items():
-                if job.completed_at and (current_time - job.completed_at) > self.job_ttl_seconds:
-                    jobs_to_remove.append(job_id)
-
-            for job_id in jobs_to_remove:
-                del self.jobs[job_id]
-
-            return len(jobs_to_remove)
-
-    def delete_job(self, job_id: str) -> bool:
-        with self.thread_lock:
-            if job_id in self.jobs:
-                del self.jobs[job_id]
-                logger.info(f"Deleted job {job_id}")
-                return True
-            return False
-
-    def shutdown(self):
-        self.main_executor.shutdown(wait=True)
-        self.thumb_executor.shutdown(wait=True)
-
-    def _convert_color_type(self, img: Image.Image) -> Image.Image:
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-            return background
-        elif img.mode != 'RGB':
-            return img.convert('RGB')
-        return img
\ No newline at end of file
+                logger.error(f"Job sweep failed: {e}")
+
+    async def delete_job(self, job_id: str) -> bool:
+        if await self.job_store.delete(job_id):
+            logger.info(f"Deleted job {job_id}")
+            return True
+        return False
+
+    async def shutdown(self):
+        # Let queued and in-flight jobs finish their uploads before the Mongo clients are closed
+        await self.queue.join()
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        tasks = self.workers + ([self.sweeper] if self.sweeper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.engine.shutdown(wait=True)
\ No newline at end of file
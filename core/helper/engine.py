@@ -0,0 +1,88 @@
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+import logging, multiprocessing, os, threading
+
+logger = logging.getLogger(__name__)
+
+
+def cpu_count() -> int:
+    # Respect CPU affinity (e.g. docker --cpuset-cpus) where the platform exposes it
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+class ConversionEngine:
+    """Executes the CPU-bound render functions of `core.helper.render`.
+
+    The submitted callables must be module-level functions that take and
+    return plain data (paths, bytes) so every engine can run them. Engines
+    that share memory with the caller may also be handed open file objects.
+    """
+    name = "base"
+    shares_memory = True
+
+    def __init__(self, executor: Executor, max_workers: int):
+        self.executor = executor
+        self.max_workers = max_workers
+        # Submitted calls not finished yet, running or waiting for a worker
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Optional[Future]):
+        with self._lock:
+            self.pending -= 1
+
+    def stats(self) -> dict:
+        active = min(self.pending, self.max_workers)
+        return {"name": self.name, "workers": self.max_workers, "active": active, "queued": self.pending - active}
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
+
+
+class ThreadEngine(ConversionEngine):
+    name = "thread"
+
+    def __init__(self, max_workers: Optional[int] = None):
+        max_workers = max_workers or 4
+        super().__init__(ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="convert"), max_workers)
+
+
+class ProcessEngine(ConversionEngine):
+    name = "process"
+    shares_memory = False
+
+    def __init__(self, max_workers: Optional[int] = None):
+        max_workers = max_workers or cpu_count()
+        # "spawn" keeps the workers independent from the event loop and the
+        # Mongo client threads of the API process.
+        context = multiprocessing.get_context("spawn")
+        super().__init__(ProcessPoolExecutor(max_workers=max_workers, mp_context=context), max_workers)
+
+
+ENGINES = {
+    ThreadEngine.name: ThreadEngine,
+    ProcessEngine.name: ProcessEngine,
+}
+
+
+def create_engine(name: str, max_workers: Optional[int] = None) -> ConversionEngine:
+    engine_cls = ENGINES.get(name)
+    if engine_cls is None:
+        raise ValueError(f"Unknown conversion engine: {name}. Expected one of {', '.join(ENGINES)}")
+
+    engine = engine_cls(max_workers=max_workers)
+    logger.info(f"Conversion engine: {engine.name} with {engine.max_workers} workers")
+    return engine
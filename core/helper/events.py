@@ -0,0 +1,128 @@
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+import asyncio, json
+
+# Interval of the comment lines that keep idle event streams open through proxies
+KEEPALIVE_SECONDS = 15
+# How long a stream with a store lookup waits for an event before reading the record itself
+STORE_POLL_SECONDS = 2
+
+
+class EventBroker:
+    """In-process publish/subscribe of job state changes, by topic.
+
+    Topics are "job:<id>", "group:<id>" and "album:<id>". Each subscriber gets a
+    bounded queue; a subscriber that stops reading loses its oldest events rather
+    than blocking the Converter. Events of jobs run by another worker process never
+    arrive here, `open_event_stream` polls the job store for those.
+    """
+
+    def __init__(self, max_pending: int = 100):
+        self.max_pending = max_pending
+        self.subscribers: dict[str, set[asyncio.Queue]] = {}
+
+    def publish(self, topics: list[str], event: dict):
+        for topic in topics:
+            for queue in self.subscribers.get(topic, ()):
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(event)
+
+    def subscribe(self, topic: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.max_pending)
+        self.subscribers.setdefault(topic, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, topic: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(topic)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[topic]
+
+    def stats(self) -> dict:
+        return {"topics": len(self.subscribers), "subscribers": sum(len(queues) for queues in self.subscribers.values())}
+
+
+def record_event(record: Any) -> dict:
+    """Event for a job record: its kind, id, API response and whether it is the last one."""
+    return {"event": record.event_kind, "id": record.id, "final": record.finished, "data": record.to_response()}
+
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'], separators=(',', ':'))}\n\n"
+
+
+async def event_stream(queue: asyncio.Queue, initial: Optional[dict] = None, until_final: Optional[str] = None,
+                       refresh: Optional[Callable[[], Awaitable]] = None) -> AsyncIterator[str]:
+    """Server-Sent Events from a subscription queue.
+
+    `initial` is sent first, so a client that subscribes late still gets the current
+    state. With `until_final`, the stream ends after the final event of that record id.
+    `refresh` reads the record from the job store after STORE_POLL_SECONDS without an
+    event, and its state is sent when it changed: with a shared store the job may run
+    in another worker process, whose events this broker never sees.
+    """
+    if initial is not None:
+        yield format_sse(initial)
+        if until_final and initial["id"] == until_final and initial["final"]:
+            return
+
+    timeout = STORE_POLL_SECONDS if refresh is not None else KEEPALIVE_SECONDS
+    last, idle = initial, 0
+    while True:
+        try:
+            event = await asyncio.wait_for(queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            event = None
+            if refresh is not None:
+                record = await refresh()
+                if record is not None:
+                    event = record_event(record)
+                    if last is not None and event["data"] == last["data"]:
+                        event = None
+
+            if event is None:
+                idle += timeout
+                if idle >= KEEPALIVE_SECONDS:
+                    idle = 0
+                    yield ": keepalive\n\n"
+                continue
+
+        last, idle = event, 0
+        yield format_sse(event)
+        if until_final and event["id"] == until_final and event["final"]:
+            return
+
+
+async def open_event_stream(broker: EventBroker, topic: str, lookup: Optional[Callable[[], Awaitable]] = None,
+                            until_final: Optional[str] = None) -> Optional[StreamingResponse]:
+    """Subscribe to `topic` and stream its events, starting with the record returned by `lookup()`.
+
+    The subscription is made before the lookup so no state change falls in between.
+    `lookup` is called again whenever the stream is idle, see `event_stream`.
+    Returns None when `lookup` finds nothing.
+    """
+    queue = broker.subscribe(topic)
+    try:
+        record = await lookup() if lookup is not None else None
+    except Exception:
+        broker.unsubscribe(topic, queue)
+        raise
+
+    if lookup is not None and record is None:
+        broker.unsubscribe(topic, queue)
+        return None
+
+    async def stream():
+        try:
+            async for chunk in event_stream(queue, record_event(record) if record else None, until_final, lookup):
+                yield chunk
+        finally:
+            broker.unsubscribe(topic, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
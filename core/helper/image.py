@@ -1,36 +1,90 @@
-from fastapi.responses import StreamingResponse
-from core.models.image import UploadImageParams, UploadImageResponse, DeleteImageParams, GetImageParams
-from fastapi import Request
-import os
-import uuid
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from core.models.image import UploadImageParams, UploadImageResponse, BatchUploadImageParams, BatchUploadImageResponse, DeleteImageParams, GetImageParams, StoredFile
+from fastapi import Request, UploadFile
+from bson import ObjectId
+from email.utils import format_datetime
 from io import BytesIO
+from typing import BinaryIO, Optional
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# GridFS files are never modified after upload, so a file id always names the same bytes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+async def hash_upload(upload: UploadFile) -> tuple[BinaryIO, str]:
+    """Take the spooled file of an upload, returning it rewound with the SHA-256 of its content.
+
+    The multipart parser already spooled the upload, in memory or to a temporary file.
+    It is read in chunks through UploadFile, which reads files rolled to disk off the
+    event loop, and detached so closing the request's form after the response leaves
+    it open. The caller owns the returned file and must close it.
+    """
+    digest = hashlib.sha256()
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        digest.update(chunk)
+    await upload.seek(0)
+
+    source = upload.file
+    upload.file = BytesIO()
+    return source, digest.hexdigest()
+
 async def upload_image(params: UploadImageParams, request: Request) -> UploadImageResponse:
     try:
         converter = request.app.state.converter
         album_client = request.app.state.album_client
+        image_client = request.app.state.image_client
         logger.info(f"Converter and album_client retrieved from app state")
 
-        temp_filename = f"{uuid.uuid4().hex}_{params.image.filename}"
-        temp_path = f"/tmp/{temp_filename}"
-
-        logger.info(f"{temp_path}")
-        with open(temp_path, "wb") as f:
-            content = await params.image.read()
-            f.write(content)
+        # Reject before hashing when the upload would not be admitted anyway
+        converter.check_capacity()
+        source, content_hash = await hash_upload(params.image)
+        filename = params.image.filename or "image"
 
-        job_id = converter.submit(temp_path, params.image.filename or "image", params.album_id, album_client)
+        try:
+            existing = await image_client.retainImageByHash(content_hash)
+            if existing:
+                # Same content as an earlier upload, only the album association is left to do.
+                # The job holds the reference taken here until the image is in the album.
+                source.close()
+                job_id = await converter.submit_existing(existing, filename, params.album_id, album_client)
+            else:
+                job_id = await converter.submit(source, filename, params.album_id, album_client, content_hash)
+        except Exception:
+            source.close()
+            raise
 
         logger.info(f"Upload complete: {job_id}")
         return UploadImageResponse(status=True, job_id=job_id)
 
     except Exception as e:
         logger.error(f"Upload failed:{e}")
-        if 'temp_path' in locals() and os.path.exists(temp_path):
-            os.remove(temp_path)
+        raise e
+
+async def upload_images(params: BatchUploadImageParams, request: Request) -> BatchUploadImageResponse:
+    sources = []
+    try:
+        converter = request.app.state.converter
+        album_client = request.app.state.album_client
+
+        # The batch is admitted or rejected as a whole, before anything is hashed
+        converter.check_capacity(len(params.images))
+        for image in params.images:
+            source, content_hash = await hash_upload(image)
+            sources.append((source, image.filename or "image", content_hash))
+
+        group = await converter.submit_batch(sources, params.album_id, album_client)
+
+        logger.info(f"Batch upload complete: {group.id} ({len(group.job_ids)} images)")
+        return BatchUploadImageResponse(status=True, group_id=group.id, job_ids=group.job_ids)
+
+    except Exception as e:
+        for source, _, _ in sources:
+            source.close()
+        logger.error(f"Batch upload failed:{e}")
         raise e
 
 async def delete_image(params: DeleteImageParams, request: Request) -> bool:
@@ -38,12 +92,7 @@ async def delete_image(params: DeleteImageParams, request: Request) -> bool:
         album_client = request.app.state.album_client
         image_client = request.app.state.image_client
 
-        album = await album_client.getAlbumById(str(params.album_id))
-        if album is None:
-            logger.warning(f"Album not found")
-            return False
-
-        image_pair = next((pair for pair in album.content if pair.image_id == params.image_id), None)
+        image_pair = await album_client.getImagePair(str(params.album_id), params.image_id)
         if image_pair is None:
             logger.warning(f"Image not in album")
             return False
@@ -54,6 +103,11 @@ async def delete_image(params: DeleteImageParams, request: Request) -> bool:
             logger.warning(f"Failed to remove image: {result.message}")
             return False
 
+        # Files of a re-uploaded image may still be referenced by another album
+        if params.image_id not in await image_client.releaseImages([params.image_id]):
+            logger.info(f"Image {params.image_id} still referenced, keeping its files")
+            return True
+
         main_deleted = await image_client.deleteFileFromBucket(params.image_id)
 
         if not main_deleted:
@@ -68,47 +122,176 @@ async def delete_image(params: DeleteImageParams, request: Request) -> bool:
         logger.error(f"Delete image failed: {e}")
         return False
 
-async def get_image(params: GetImageParams, request: Request) -> StreamingResponse | None:
+async def get_image(params: GetImageParams, request: Request) -> Response | None:
     try: 
         album_client = request.app.state.album_client
         image_client = request.app.state.image_client
 
-        album = await album_client.getAlbumById(str(params.album_id))
-        if album is None:
-            logger.warning(f"Album not found")
-            return None
-
-        if not any(pair.image_id == params.image_id for pair in album.content):
+        if await album_client.getImagePair(str(params.album_id), params.image_id) is None:
             logger.warning(f"Image not in album")
             return None
 
-        contents = await image_client.getFileFromBucket(params.image_id)
+        stored = await image_client.openFileFromBucket(params.image_id)
 
-        if contents is not None:
-            return StreamingResponse(
-                BytesIO(contents),
-                media_type="image/webp",
-                headers={"Content-Disposition": f"inline; filename=image_{params.image_id}.webp"}
-            )
+        if stored is not None:
+            return file_response(stored, "image", request)
         return None
 
     except Exception as e:
         logger.error(f"Get image failed: {e}")
         return None
 
-async def get_thumbnail(id: str, request: Request) -> StreamingResponse | None:
+async def get_thumbnail(id: str, request: Request) -> Response | None:
     try:
         image_client = request.app.state.image_client
 
-        contents = await image_client.getFileFromBucket(id)
+        stored = await image_client.openFileFromBucket(id)
 
-        if contents is not  None:
-            return StreamingResponse(
-                BytesIO(contents),
-                media_type="image/webp",
-                headers={"Content-Disposition": f"inline; filename=thumbnail_{id}.webp"}
-            )
+        if stored is not None:
+            return file_response(stored, "thumbnail", request)
         return None
     except Exception as e:
         logger.error(f"Get thumbnail failed: {e}")
-        return None
\ No newline at end of file
+        return None
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def file_etag(file_id: str) -> str:
+    return f'"{file_id}"'
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    # Weak comparison as required for If-None-Match (RFC 9110 13.1.2)
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+def parse_range(range_header: Optional[str], length: int) -> Optional[tuple[int, int]]:
+    """Inclusive byte range of a single-range `Range` header, or None to send the whole file.
+
+    Multiple ranges and malformed headers are ignored, which RFC 9110 allows.
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec:
+        return None
+
+    first, separator, last = spec.partition("-")
+    if not separator:
+        return None
+    try:
+        if first == "":
+            # Suffix range: the last N bytes
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+            start, end = max(0, length - suffix), length - 1
+        else:
+            start = int(first)
+            end = min(int(last), length - 1) if last else length - 1
+    except ValueError:
+        return None
+
+    if start < 0 or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+def accepts_avif(request: Request) -> bool:
+    """Whether the `Accept` header lists image/avif with a non-zero quality."""
+    for media_range in request.headers.get("accept", "").split(","):
+        media_type, _, params = media_range.partition(";")
+        if media_type.strip().lower() != "image/avif":
+            continue
+        quality = params.strip().removeprefix("q=")
+        try:
+            return not quality or float(quality) > 0
+        except ValueError:
+            return True
+    return False
+
+def file_response(stored: StoredFile, prefix: str, request: Request, extra_headers: Optional[dict] = None) -> Response:
+    """Stream a file from ImageClient.openFileFromBucket, honouring `Range` requests.
+
+    The file's download stream is closed once the response is sent, also when its
+    body is never read, e.g. for a 416 answer.
+    """
+    image_client = request.app.state.image_client
+    close_file = BackgroundTask(image_client.closeFile, stored)
+    etag = file_etag(stored.id)
+    extension = stored.content_type.rsplit("/", 1)[-1]
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "Last-Modified": format_datetime(stored.upload_date, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"inline; filename={prefix}_{stored.id}.{extension}",
+        **(extra_headers or {})
+    }
+
+    if_range = request.headers.get("if-range")
+    range_header = request.headers.get("range") if if_range is None or if_range == etag else None
+    try:
+        byte_range = parse_range(range_header, stored.length)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{stored.length}", **(extra_headers or {})},
+                        background=close_file)
+
+    if byte_range is None:
+        headers["Content-Length"] = str(stored.length)
+        return StreamingResponse(image_client.iterFileChunks(stored), media_type=stored.content_type, headers=headers,
+                                 background=close_file)
+
+    start, end = byte_range
+    headers["Content-Length"] = str(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{stored.length}"
+    return StreamingResponse(
+        image_client.iterFileChunks(stored, start, end),
+        status_code=206,
+        media_type=stored.content_type,
+        headers=headers,
+        background=close_file
+    )
+
+async def get_file_response(file_id: str, prefix: str, request: Request, extra_headers: Optional[dict] = None) -> Response | None:
+    """Serve a GridFS file by id with validators that let browsers and CDNs cache it forever."""
+    try:
+        if not ObjectId.is_valid(file_id):
+            return None
+
+        etag = file_etag(file_id)
+
+        # The ETag is derived from the id alone, revalidation never needs the bucket
+        if is_not_modified(request, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL, **(extra_headers or {})})
+
+        image_client = request.app.state.image_client
+        stored = await image_client.openFileFromBucket(file_id)
+        if stored is None:
+            return None
+
+        return file_response(stored, prefix, request, extra_headers)
+    except Exception as e:
+        logger.error(f"Get file failed: {e}")
+        return None
+
+
+async def get_rendition_response(file_id: str, prefix: str, width: Optional[int], request: Request) -> Response | None:
+    """Serve the smallest rendition at least `width` pixels wide, as AVIF if enabled and accepted."""
+    try:
+        if not ObjectId.is_valid(file_id):
+            return None
+
+        renditions = request.app.state.renditions
+        # Each variant has its own id and so its own ETag; caches must key on Accept too
+        extra_headers = {"Vary": "Accept"} if renditions.avif_profile else None
+        target_id = await renditions.resolve(file_id, width, avif=accepts_avif(request))
+        if target_id is None:
+            return None
+
+        return await get_file_response(target_id, prefix, request, extra_headers)
+    except Exception as e:
+        logger.error(f"Get rendition failed: {e}")
+        return None
@@ -0,0 +1,117 @@
+from collections import OrderedDict, deque
+from core.helper import metrics
+from typing import Any, Optional
+import asyncio, math, time
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Conversion queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class BatchTooLargeError(Exception):
+    def __init__(self, max_size: int):
+        super().__init__(f"Batch is larger than the conversion queue, at most {max_size} images")
+        self.max_size = max_size
+
+
+class FairJobQueue:
+    """Bounded FIFO per key, served round-robin across keys.
+
+    Jobs are keyed by album so a bulk import into one album cannot starve uploads
+    to other albums. `put_nowait` never blocks, it raises QueueFullError with an
+    estimated Retry-After once `max_depth` jobs are waiting. The estimate starts
+    from `expected_service_seconds` per job until finished jobs have been timed.
+    """
+
+    # Weight of the latest sample in the moving averages
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, max_depth: int, concurrency: int, expected_service_seconds: float = 2.0):
+        self.max_depth = max_depth
+        self.concurrency = concurrency
+        self._queues: OrderedDict[str, deque] = OrderedDict()
+        self._size = 0
+        self._items = asyncio.Semaphore(0)
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+        self.in_flight = 0
+        self.accepted_total = 0
+        self.rejected_total = 0
+        self.avg_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.avg_service_seconds = expected_service_seconds
+
+    def __len__(self) -> int:
+        return self._size
+
+    def full(self, count: int = 1) -> bool:
+        return self._size + count > self.max_depth
+
+    def retry_after(self) -> int:
+        # Time for the workers to drain the current backlog at the observed service rate
+        drain_seconds = (self._size + self.in_flight) * self.avg_service_seconds / self.concurrency
+        return max(1, math.ceil(drain_seconds))
+
+    def check_capacity(self, count: int = 1):
+        # Waiting would not help a batch that does not fit in an empty queue
+        if count > self.max_depth:
+            raise BatchTooLargeError(self.max_depth)
+        if self.full(count):
+            self.rejected_total += 1
+            raise QueueFullError(self.retry_after())
+
+    def put_nowait(self, key: Optional[str], item: Any):
+        self.check_capacity()
+
+        self._queues.setdefault(key or "", deque()).append((time.monotonic(), item))
+        self._size += 1
+        self._unfinished += 1
+        self._finished.clear()
+        self.accepted_total += 1
+        self._items.release()
+
+    async def get(self) -> Any:
+        await self._items.acquire()
+
+        key, entries = next(iter(self._queues.items()))
+        enqueued_at, item = entries.popleft()
+        if entries:
+            self._queues.move_to_end(key)
+        else:
+            del self._queues[key]
+        self._size -= 1
+        self.in_flight += 1
+
+        wait = time.monotonic() - enqueued_at
+        self.avg_wait_seconds += self.EWMA_ALPHA * (wait - self.avg_wait_seconds)
+        self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        metrics.CONVERSION_STAGE_SECONDS.labels("queue").observe(wait)
+        return item
+
+    def task_done(self, service_seconds: float):
+        self.in_flight -= 1
+        self.avg_service_seconds += self.EWMA_ALPHA * (service_seconds - self.avg_service_seconds)
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._finished.set()
+
+    async def join(self):
+        await self._finished.wait()
+
+    def stats(self) -> dict:
+        return {
+            "depth": self._size,
+            "max_depth": self.max_depth,
+            "in_flight": self.in_flight,
+            "concurrency": self.concurrency,
+            "albums_waiting": len(self._queues),
+            "accepted_total": self.accepted_total,
+            "rejected_total": self.rejected_total,
+            "avg_wait_seconds": round(self.avg_wait_seconds, 3),
+            "max_wait_seconds": round(self.max_wait_seconds, 3),
+            "avg_service_seconds": round(self.avg_service_seconds, 3),
+        }
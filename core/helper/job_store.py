@@ -0,0 +1,96 @@
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+import asyncio, threading, time
+
+
+class JobStore(ABC):
+    """Where the Converter keeps job records (jobs, album deletions and job groups) by id.
+
+    The Converter mutates its in-flight records and calls `save` after every state
+    change, so a store may either keep the live object or persist a snapshot.
+    """
+
+    async def init(self):
+        pass
+
+    @abstractmethod
+    async def save(self, record: Any):
+        ...
+
+    @abstractmethod
+    async def get(self, record_id: str) -> Optional[Any]:
+        ...
+
+    async def get_many(self, record_ids: list[str]) -> list[Any]:
+        records = [await self.get(record_id) for record_id in record_ids]
+        return [record for record in records if record is not None]
+
+    @abstractmethod
+    async def delete(self, record_id: str) -> bool:
+        ...
+
+    async def cleanup(self, ttl_seconds: float, max_records: Optional[int] = None) -> int:
+        """Remove records completed more than `ttl_seconds` ago, and the oldest completed
+        ones while more than `max_records` remain. Returns how many were removed.
+        """
+        return 0
+
+    async def close(self):
+        pass
+
+
+class InMemoryJobStore(JobStore):
+    """Records live in a dict of this process; lost on restart and not shared between workers."""
+
+    # Records removed per acquisition of the lock during cleanup, so lookups are not stalled
+    CLEANUP_BATCH_SIZE = 500
+
+    def __init__(self):
+        self.records = {}
+        self.thread_lock = threading.Lock()
+
+    async def save(self, record: Any):
+        with self.thread_lock:
+            self.records[record.id] = record
+
+    async def get(self, record_id: str) -> Optional[Any]:
+        with self.thread_lock:
+            return self.records.get(record_id)
+
+    async def get_many(self, record_ids: list[str]) -> list[Any]:
+        with self.thread_lock:
+            return [self.records[record_id] for record_id in record_ids if record_id in self.records]
+
+    async def delete(self, record_id: str) -> bool:
+        with self.thread_lock:
+            return self.records.pop(record_id, None) is not None
+
+    async def cleanup(self, ttl_seconds: float, max_records: Optional[int] = None) -> int:
+        # Work on a snapshot so the lock is only held for the copy and the removals
+        with self.thread_lock:
+            records = list(self.records.items())
+
+        current_time = time.time()
+        expired = []
+        kept = []
+        for record_id, record in records:
+            if record.completed_at and (current_time - record.completed_at) > ttl_seconds:
+                expired.append(record_id)
+            elif record.completed_at:
+                kept.append((record.completed_at, record_id))
+
+        remaining = len(records) - len(expired)
+        if max_records is not None and remaining > max_records:
+            # Records still in progress are never evicted
+            kept.sort()
+            expired.extend(record_id for _, record_id in kept[:remaining - max_records])
+
+        removed = 0
+        for start in range(0, len(expired), self.CLEANUP_BATCH_SIZE):
+            with self.thread_lock:
+                for record_id in expired[start:start + self.CLEANUP_BATCH_SIZE]:
+                    if self.records.pop(record_id, None) is not None:
+                        removed += 1
+            # Let request handlers run between batches
+            await asyncio.sleep(0)
+        return removed
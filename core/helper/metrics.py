@@ -0,0 +1,104 @@
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+import asyncio
+
+# From sub-millisecond Mongo calls to multi-second conversions of large images
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Where the time of a conversion job goes: "queue" waiting for a Converter worker,
+# "engine_wait" for an engine worker, "decode", "resize", "encode" and "thumbnail" on the
+# engine (CPU), "upload" to GridFS, "album" updating the album and "total" per job.
+# "rendition" is the render of an on-demand rendition, engine wait included.
+CONVERSION_STAGE_SECONDS = Histogram(
+    "conversion_stage_seconds", "Time spent in each stage of an image conversion job",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+CONVERSION_JOBS = Counter("conversion_jobs", "Conversion jobs finished, by outcome", ["status"])
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to send the complete response, by route template",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+
+MONGO_COMMAND_SECONDS = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command round trips as reported by the driver",
+    ["command", "collection"], buckets=LATENCY_BUCKETS
+)
+MONGO_COMMAND_FAILURES = Counter("mongo_command_failures", "MongoDB commands that failed", ["command", "collection"])
+
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds", "How late a timer scheduled on the event loop fires",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+
+class AppCollector(Collector):
+    """State read from the app's objects at scrape time: engine and queue occupancy, caches, event streams."""
+
+    def __init__(self, converter, image_client, renditions):
+        self.converter = converter
+        self.image_client = image_client
+        self.renditions = renditions
+
+    def collect(self):
+        engine = self.converter.engine.stats()
+        for name, documentation in (
+            ("workers", "Workers of the conversion engine"),
+            ("active", "Engine workers running a render"),
+            ("queued", "Renders waiting for an engine worker")
+        ):
+            gauge = GaugeMetricFamily(f"converter_engine_{name}", documentation, labels=["engine"])
+            gauge.add_metric([engine["name"]], engine[name])
+            yield gauge
+
+        queue = self.converter.queue_stats()
+        yield GaugeMetricFamily("converter_queue_depth", "Conversion jobs waiting for a worker", value=queue["depth"])
+        yield GaugeMetricFamily("converter_queue_in_flight", "Conversion jobs being processed", value=queue["in_flight"])
+        yield CounterMetricFamily("converter_queue_rejected", "Uploads rejected with a full queue", value=queue["rejected_total"])
+
+        caches = {"files": self.image_client.cache_stats(), "rendition_ids": self.renditions.stats()["ids"]}
+        hits = CounterMetricFamily("cache_hits", "Cache lookups that found an entry", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache lookups that found nothing", labels=["cache"])
+        ratio = GaugeMetricFamily("cache_hit_ratio", "Hits over lookups since startup", labels=["cache"])
+        size = GaugeMetricFamily("cache_size", "Size of the cached entries, bytes for the file cache", labels=["cache"])
+        for name, stats in caches.items():
+            if stats is None:
+                continue
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            ratio.add_metric([name], stats["hit_ratio"])
+            size.add_metric([name], stats["bytes"])
+        yield from (hits, misses, ratio, size)
+
+        events = self.converter.events.stats()
+        yield GaugeMetricFamily("event_stream_subscribers", "Open job event streams", value=events["subscribers"])
+        yield GaugeMetricFamily("renditions_generating", "Renditions being rendered", value=len(self.renditions.pending))
+
+
+def register_app_collector(converter, image_client, renditions) -> AppCollector:
+    collector = AppCollector(converter, image_client, renditions)
+    REGISTRY.register(collector)
+    return collector
+
+
+def unregister_collector(collector: Collector):
+    REGISTRY.unregister(collector)
+
+
+async def monitor_event_loop(interval_seconds: float = 0.5):
+    """Record how late a sleep of `interval_seconds` wakes up.
+
+    Lag grows when callbacks block the loop, e.g. CPU work or synchronous I/O
+    done outside the conversion engine, and delays every request.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval_seconds)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - start - interval_seconds))
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """The exposition of every registered metric, and its content type."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
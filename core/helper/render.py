@@ -0,0 +1,205 @@
+from dataclasses import dataclass
+from io import BytesIO
+from PIL import Image
+from typing import BinaryIO, Optional, Union
+import logging, time
+
+logger = logging.getLogger(__name__)
+
+# Register the HEIF/AVIF decoders here so that worker processes, which only
+# import this module, can open the same formats as the API process.
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    logger.warning("pillow_heif is not installed, HEIF/HEIC decoding is disabled")
+
+try:
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+MAIN_SIZE = (1920, 1080)
+THUMBNAIL_SIZE = (512, 512)
+
+
+@dataclass(frozen=True)
+class EncoderProfile:
+    """How a rendition is encoded.
+
+    `quality` is the lossy quality, or the compression effort when `lossless`.
+    `method` is the WebP effort (0 fast .. 6 small) and `speed` the AVIF one
+    (0 slow .. 10 fast). Without `keep_alpha` transparency is flattened onto white.
+    """
+    format: str = "WEBP"
+    quality: int = 80
+    method: int = 4
+    speed: int = 6
+    lossless: bool = False
+    keep_alpha: bool = False
+
+    @property
+    def content_type(self) -> str:
+        return f"image/{self.format.lower()}"
+
+    @property
+    def extension(self) -> str:
+        return self.format.lower()
+
+
+PROFILES = {
+    "webp": EncoderProfile(),
+    "webp-fast": EncoderProfile(quality=75, method=2),
+    "webp-small": EncoderProfile(quality=70, method=6),
+    "webp-alpha": EncoderProfile(keep_alpha=True),
+    "webp-lossless": EncoderProfile(quality=50, lossless=True, keep_alpha=True),
+    # What every file was encoded with before profiles existed
+    "webp-max": EncoderProfile(quality=100),
+    "avif": EncoderProfile(format="AVIF", quality=60, speed=6, keep_alpha=True),
+}
+
+
+def get_profile(name: str) -> EncoderProfile:
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown encoder profile '{name}', expected one of {', '.join(PROFILES)}")
+
+
+def convert_color_type(img: Image.Image) -> Image.Image:
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        return background
+    elif img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def has_alpha(img: Image.Image) -> bool:
+    return img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+
+
+def prepare_frame(img: Image.Image, keep_alpha: bool) -> Image.Image:
+    """RGBA when transparency has to be kept, RGB otherwise."""
+    if keep_alpha and has_alpha(img):
+        return img if img.mode == 'RGBA' else img.convert('RGBA')
+    return convert_color_type(img)
+
+
+def encode(img: Image.Image, profile: EncoderProfile) -> bytes:
+    if img.mode != 'RGB' and not (profile.keep_alpha and img.mode == 'RGBA'):
+        img = convert_color_type(img)
+
+    buffer = BytesIO()
+    if profile.format == 'AVIF':
+        img.save(buffer, 'AVIF', quality=profile.quality, speed=profile.speed)
+    else:
+        img.save(buffer, 'WEBP', quality=profile.quality, method=profile.method, lossless=profile.lossless)
+    return buffer.getvalue()
+
+
+def fit_size(size: tuple[int, int], bound: tuple[int, int]) -> tuple[int, int]:
+    """Largest size with the same aspect ratio that fits in `bound`, never enlarging."""
+    width, height = size
+    scale = min(bound[0] / width, bound[1] / height, 1)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def cover_size(size: tuple[int, int], side: int) -> tuple[int, int]:
+    """Smallest size with the same aspect ratio whose short side is at least `side`, never enlarging."""
+    width, height = size
+    scale = min(side / min(width, height), 1)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def cover_box(size: tuple[int, int], bound: int) -> tuple[tuple[int, int, int, int], int]:
+    """Centered square crop box of a (width, height) frame and the side it is scaled to.
+
+    The square is as large as the frame allows and is scaled down to at most `bound`,
+    never enlarged.
+    """
+    width, height = size
+    side = min(width, height)
+    left, top = (width - side) // 2, (height - side) // 2
+    return (left, top, left + side, top + side), min(side, bound)
+
+
+def cover_thumbnail(img: Image.Image, box: tuple[int, int, int, int], side: int) -> Image.Image:
+    # Cropping through `box` lets the resampler read only the square, in one pass
+    return img.resize((side, side), Image.Resampling.LANCZOS, box=box, reducing_gap=2.0)
+
+
+def thumbnail_image(frame: Image.Image, profile: EncoderProfile = PROFILES["webp"]) -> Image.Image:
+    """Cover-crop a decoded frame to a square of at most 512x512."""
+    box, side = cover_box(frame.size, THUMBNAIL_SIZE[0])
+    return cover_thumbnail(prepare_frame(frame, profile.keep_alpha), box, side)
+
+
+def render_renditions(src: Union[str, bytes, BinaryIO], main_profile: EncoderProfile = PROFILES["webp"],
+                      thumbnail_profile: EncoderProfile = PROFILES["webp"]) -> tuple[bytes, bytes, dict[str, float]]:
+    """Decode the source once and encode the main rendition and the thumbnail from that frame.
+
+    `src` is a path, the encoded file contents or a binary file object. Returns the
+    encoded bytes of the 1920x1080 bounded main image and the square, at most 512x512,
+    thumbnail, with the seconds spent decoding, resizing and encoding the main image
+    and making the thumbnail.
+    """
+    if isinstance(src, bytes):
+        src = BytesIO(src)
+
+    timings = {}
+    start_time = time.perf_counter()
+    with Image.open(src) as img:
+        # JPEG can decode at 1/2, 1/4 or 1/8 scale; ask for the smallest scale that still
+        # covers the main rendition and the thumbnail. Other formats ignore the draft request.
+        main_size, thumb_size = fit_size(img.size, MAIN_SIZE), cover_size(img.size, THUMBNAIL_SIZE[0])
+        img.draft(None, (max(main_size[0], thumb_size[0]), max(main_size[1], thumb_size[1])))
+        img.load()
+        frame = prepare_frame(img, main_profile.keep_alpha)
+        timings["decode"] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        main_img = frame.resize(fit_size(frame.size, MAIN_SIZE), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        timings["resize"] = time.perf_counter() - start_time
+
+        # Cropping the main image is much cheaper than the full frame, but fitting in 1920x1080
+        # shrinks the short side of tall or wide sources below the thumbnail side, e.g. 1000x5000
+        # to 216x1080. Those are cropped from the frame while it is still open.
+        start_time = time.perf_counter()
+        thumb_img = thumbnail_image(frame if min(main_img.size) < THUMBNAIL_SIZE[0] else main_img, thumbnail_profile)
+        del frame
+        timings["thumbnail"] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    main_bytes = encode(main_img, main_profile)
+    timings["encode"] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    thumb_bytes = encode(thumb_img, thumbnail_profile)
+    timings["thumbnail"] += time.perf_counter() - start_time
+
+    return main_bytes, thumb_bytes, timings
+
+
+def render_variant(src: Union[bytes, BinaryIO], width: Optional[int], profile: EncoderProfile) -> Optional[bytes]:
+    """Re-encode a stored rendition with `profile`, scaled down to `width` pixels wide if given.
+
+    Returns None when the result would be the same as the source: a WebP that is
+    not wider than `width`.
+    """
+    if isinstance(src, bytes):
+        src = BytesIO(src)
+
+    with Image.open(src) as img:
+        if width is not None and img.width <= width:
+            if profile.format == 'WEBP':
+                return None
+            width = None
+
+        frame = prepare_frame(img, profile.keep_alpha)
+        if width is not None:
+            frame = frame.resize(fit_size(frame.size, (width, frame.height)), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        return encode(frame, profile)
@@ -0,0 +1,98 @@
+from core.helper import metrics
+from core.helper.cache import ByteLRUCache
+from core.helper.engine import ConversionEngine
+from core.helper.render import EncoderProfile, PROFILES, render_variant
+from typing import Optional
+import asyncio, logging, time
+
+logger = logging.getLogger(__name__)
+
+
+class RenditionLadder:
+    """Narrower copies of stored images, and AVIF versions of them, made on first request.
+
+    A width hint is rounded up to the next rung of `widths`; hints above the top rung
+    get the stored image itself, which is the largest version kept. A rendition is
+    rendered on the conversion engine from the stored image with `profile`, or with
+    `avif_profile` for clients that accept AVIF, saved to GridFS as
+    `rendition_{source_id}_{width}.{ext}`, and found again by its metadata.
+    Without an `avif_profile` only WebP is served.
+    """
+
+    def __init__(self, image_client, engine: ConversionEngine, widths: list[int], max_cached_ids: int = 10000,
+                 profile: EncoderProfile = PROFILES["webp"], avif_profile: Optional[EncoderProfile] = None):
+        if profile.format != "WEBP":
+            raise ValueError("The rendition profile must encode WebP, AVIF is only served when accepted")
+        self.image_client = image_client
+        self.engine = engine
+        self.widths = sorted(set(widths))
+        self.profile = profile
+        self.avif_profile = avif_profile
+        # (source id, width) -> id of the file to serve; ids are immutable, so are the entries
+        self.file_ids: ByteLRUCache[str] = ByteLRUCache(max_bytes=max_cached_ids)
+        # Renditions being generated, so concurrent first requests share one render
+        self.pending: dict[str, asyncio.Task] = {}
+
+    def select(self, width_hint: Optional[int]) -> Optional[int]:
+        """Smallest rung at least `width_hint` wide, or None for the stored image."""
+        if not width_hint or width_hint <= 0:
+            return None
+        return next((width for width in self.widths if width >= width_hint), None)
+
+    async def resolve(self, source_id: str, width_hint: Optional[int], avif: bool = False) -> Optional[str]:
+        """Id of the file to serve for `source_id` at `width_hint`, or None if the source does not exist.
+
+        With `avif`, an AVIF rendition is served if AVIF output is enabled.
+        """
+        width = self.select(width_hint)
+        profile = self.avif_profile if avif and self.avif_profile else self.profile
+        if width is None and profile.format == "WEBP":
+            return source_id
+
+        key = f"{source_id}:{width}:{profile.extension}"
+        file_id = self.file_ids.get(key)
+        if file_id is not None:
+            return file_id
+
+        task = self.pending.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._find_or_create(source_id, width, profile))
+            self.pending[key] = task
+            task.add_done_callback(lambda _: self.pending.pop(key, None))
+
+        file_id = await asyncio.shield(task)
+        if file_id is not None:
+            self.file_ids.put(key, file_id, size=1)
+        return file_id
+
+    async def _find_or_create(self, source_id: str, width: Optional[int], profile: EncoderProfile) -> Optional[str]:
+        existing = await self.image_client.findRendition(source_id, width, profile.extension)
+        if existing:
+            return existing
+
+        stored = await self.image_client.getStoredFileFromBucket(source_id)
+        if stored is None:
+            return None
+
+        start_time = time.perf_counter()
+        data = await asyncio.wrap_future(self.engine.submit(render_variant, stored.contents, width, profile))
+        metrics.CONVERSION_STAGE_SECONDS.labels("rendition").observe(time.perf_counter() - start_time)
+        if data is None:
+            # The source is already narrow enough
+            return source_id
+
+        file_id = await self.image_client.uploadBytesToBucket(
+            data,
+            f"rendition_{source_id}_{width or 'full'}.{profile.extension}",
+            metadata={"source_id": source_id, "width": width, "format": profile.extension, "content_type": profile.content_type}
+        )
+        logger.info(f"Rendition {width or 'full'}/{profile.extension} of {source_id} created: {file_id}")
+        return file_id
+
+    def stats(self) -> dict:
+        return {
+            "widths": self.widths,
+            "avif": self.avif_profile is not None,
+            "generating": len(self.pending),
+            "ids": self.file_ids.stats()
+        }
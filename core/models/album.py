@@ -1,6 +1,7 @@
-from pydantic import BaseModel, ConfigDict, Field
-from typing import Optional, Tuple
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import Optional
 from datetime import datetime
+from bson import ObjectId
 
 class AlbumCreateRequest(BaseModel):
     name: str
@@ -28,4 +29,44 @@ class Album(BaseModel):
 
 class AlbumOperationResult(BaseModel):
     status: bool
-    message: str
\ No newline at end of file
+    message: str
+
+class AlbumDeleteResponse(AlbumOperationResult):
+    # Background job removing the album's images, poll it at /album/image/job/{job_id}
+    job_id: Optional[str] = None
+
+class AlbumListRequest(BaseModel):
+    limit: int = Field(50, ge=1, le=200)
+    # next_cursor of the previous page, omitted for the first page
+    cursor: Optional[str] = None
+
+    @field_validator("cursor")
+    @classmethod
+    def validate_cursor(cls, value: Optional[str]) -> Optional[str]:
+        if value is not None and not ObjectId.is_valid(value):
+            raise ValueError("cursor is not a valid album id")
+        return value
+
+class AlbumSummary(BaseModel):
+    model_config = ConfigDict(populate_by_name=True, json_encoders={datetime: lambda v: v.isoformat()})
+
+    id: str = Field(alias="_id", serialization_alias="id")
+    name: str
+    create_date: datetime
+    image_count: int
+    cover_thumbnail_id: Optional[str] = None
+
+class AlbumPage(BaseModel):
+    items: list[AlbumSummary]
+    next_cursor: Optional[str] = None
+
+class AlbumContentRequest(BaseModel):
+    id: str
+    offset: int = Field(0, ge=0)
+    limit: int = Field(100, ge=1, le=500)
+
+class AlbumContentPage(BaseModel):
+    album_id: str
+    total: int
+    offset: int
+    items: list[ImagePair]
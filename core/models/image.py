@@ -1,5 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from fastapi import UploadFile
+from datetime import datetime
+from typing import Any, Optional
 
 AllowedImageFormat = {"image/jpeg", "image/png", "image/webp", "image/heif", "image/heic", "image/avif"}
 
@@ -11,6 +13,15 @@ class UploadImageResponse(BaseModel):
     status: bool
     job_id: str
 
+class BatchUploadImageParams(BaseModel):
+    album_id: str
+    images: list[UploadFile]
+
+class BatchUploadImageResponse(BaseModel):
+    status: bool
+    group_id: str
+    job_ids: list[str]
+
 class DeleteImageParams(BaseModel):
     album_id: str
     image_id: str
@@ -22,3 +33,11 @@ class GetImageParams(BaseModel):
 class GetThumbnailParams(BaseModel):
     thumbnail_id: str
 
+class StoredFile(BaseModel):
+    id: str
+    length: int
+    content_type: str
+    upload_date: datetime
+    # Either the whole file, or an open GridFS download stream to read it chunk by chunk
+    contents: Optional[bytes] = None
+    stream: Any = Field(None, exclude=True)
@@ -2,10 +2,11 @@ from datetime import datetime
 from typing import Optional
 
 from bson import ObjectId
-from core.models.album import Album, AlbumOperationResult, ImagePair
+from core.models.album import Album, AlbumContentPage, AlbumOperationResult, AlbumPage, AlbumSummary, ImagePair
 from core.mongo.mongo import BaseMongoClient
-from pymongo.errors import CollectionInvalid
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError
 from typing import List
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,11 +14,12 @@ logger = logging.getLogger(__name__)
 class AlbumClient(BaseMongoClient):
     def __init__(self):
         super().__init__(db_name="album", coll_name="album")
+        # Albums deleted whose files are not all deleted yet, by album id
+        self.deletions = self.database.get_collection("album_deletion")
 
     async def init(self):
         try:
             await self.database.create_collection("album", check_exists=True)
-            await self.collection.create_index("name", unique=True)
         except CollectionInvalid as e:
             # Expected exception, ignore it
             logger.info(f"'album' collection already exists. Skip the createion.")
@@ -26,11 +28,12 @@ class AlbumClient(BaseMongoClient):
             logger.error(f"Failed to create 'album' collection: {e}")
             raise
 
+        # createAlbum relies on this index to reject duplicate names, make sure it
+        # also exists on collections created before it was introduced
+        await self.collection.create_index("name", unique=True)
+
     async def createAlbum(self, name: str) -> AlbumOperationResult:
         try:
-            if await self.collection.find_one({"name": name}):
-                return AlbumOperationResult(status=False, message="Album already exist")
-
             album = Album(
                 id=None,
                 name=name,
@@ -39,58 +42,147 @@ class AlbumClient(BaseMongoClient):
             )
             record = await self.collection.insert_one(album.model_dump(by_alias=True))
             return AlbumOperationResult(status=True, message=str(record.inserted_id))
+        except DuplicateKeyError:
+            return AlbumOperationResult(status=False, message="Album already exist")
         except Exception as e:
             return AlbumOperationResult(status=False, message=str(e))
 
     async def deleteAlbumByName(self, name: str) -> AlbumOperationResult:
         try:
-            if not await self.getAlbumByName(name):
+            result = await self.collection.delete_one({"name": name})
+            if not result.deleted_count:
                 return AlbumOperationResult(status=False, message="Album name does not exist.")
 
-            await self.collection.delete_one({"name": name})
             return AlbumOperationResult(status=True, message="Album delete successfully.")
         except Exception as e:
             return AlbumOperationResult(status=False, message=str(e))
-    async def addImageToAlbum(self, album_id: str, image_id: str, thumbnail_id: str) -> AlbumOperationResult:
+
+    async def deleteAlbumById(self, album_id: str) -> Optional[List[ImagePair]]:
+        """Delete an album and return the content it had when deleted, None when it does not exist."""
+        album_doc = await self.collection.find_one_and_delete({"_id": ObjectId(album_id)}, {"content": 1})
+        if album_doc is None:
+            return None
+        return [ImagePair(**pair) for pair in album_doc.get("content", [])]
+
+    async def addPendingDeletion(self, album_id: str, content: List[ImagePair]) -> bool:
+        """Record the images of an album whose files still have to be deleted, before the album is.
+
+        Returns False when a deletion of the album is already pending.
+        """
         try:
-            album = await self.getAlbumById(album_id)
-            if album is None:
-                return AlbumOperationResult(status=False, message=f"Fail to access album: {album_id} not exist.")
+            await self.deletions.insert_one({
+                "_id": album_id,
+                "content": [pair.model_dump() for pair in content],
+                "released": False,
+                "file_ids": None,
+                "create_date": datetime.now()
+            })
+            return True
+        except DuplicateKeyError:
+            return False
 
-            # Check if image already exists in album
-            if any(pair.image_id == image_id for pair in album.content):
-                return AlbumOperationResult(status=False, message="Image already in album.")
+    async def setPendingDeletionContent(self, album_id: str, content: List[ImagePair]):
+        """Replace the images recorded by addPendingDeletion with those the album had when deleted"""
+        await self.deletions.update_one(
+            {"_id": album_id, "released": False}, {"$set": {"content": [pair.model_dump() for pair in content]}}
+        )
 
+    async def claimPendingRelease(self, album_id: str) -> Optional[List[ImagePair]]:
+        """The images of a pending deletion, for the one caller that releases their references.
+
+        Returns None when an earlier or concurrent run already claimed them, so a
+        deletion resumed twice never releases an image twice.
+        """
+        doc = await self.deletions.find_one_and_update({"_id": album_id, "released": False}, {"$set": {"released": True}})
+        if doc is None:
+            return None
+        return [ImagePair(**pair) for pair in doc["content"]]
+
+    async def setPendingDeletionFiles(self, album_id: str, file_ids: List[str]):
+        await self.deletions.update_one({"_id": album_id}, {"$set": {"file_ids": file_ids}})
+
+    async def getPendingDeletionFiles(self, album_id: str) -> List[str]:
+        doc = await self.deletions.find_one({"_id": album_id}, {"file_ids": 1})
+        return (doc or {}).get("file_ids") or []
+
+    async def getPendingDeletions(self) -> List[str]:
+        return [doc["_id"] async for doc in self.deletions.find({}, {"_id": 1})]
+
+    async def removePendingDeletion(self, album_id: str):
+        await self.deletions.delete_one({"_id": album_id})
+
+    async def addImageToAlbum(self, album_id: str, image_id: str, thumbnail_id: str) -> AlbumOperationResult:
+        try:
             image_pair = ImagePair(image_id=image_id, thumbnail_id=thumbnail_id)
-            await self.collection.update_one(
-                {"_id": ObjectId(album_id)},
+            # The $ne condition makes the duplicate check and the push one atomic update
+            result = await self.collection.update_one(
+                {"_id": ObjectId(album_id), "content.image_id": {"$ne": image_id}},
                 {"$push": {
                     "content": image_pair.model_dump()
                 }})
+
+            if not result.matched_count:
+                # Only the failure path pays for a second query, to report why
+                if not await self.albumExists(album_id):
+                    return AlbumOperationResult(status=False, message=f"Fail to access album: {album_id} not exist.")
+                return AlbumOperationResult(status=False, message="Image already in album.")
+
             return AlbumOperationResult(status=True, message=f"Image {image_id} added to album successfully.")
         except Exception as e:
             return AlbumOperationResult(status=False, message=str(e))
 
-    async def deleteImageFromAlbum(self, album_id: str, image_id: str) -> AlbumOperationResult:
+    async def addImagesToAlbum(self, album_id: str, pairs: List[tuple[str, str]]) -> AlbumOperationResult:
+        """Add (image_id, thumbnail_id) pairs with a single $push/$each update.
+
+        Pairs are expected to be freshly converted images, so unlike addImageToAlbum
+        there is no per-image duplicate check.
+        """
         try:
-            album = await self.getAlbumById(album_id)
-            if album is None:
-                return AlbumOperationResult(status=False, message=f"Fail to access album: {album_id} is not exist.")
+            image_pairs = [ImagePair(image_id=image_id, thumbnail_id=thumbnail_id).model_dump() for image_id, thumbnail_id in pairs]
+            result = await self.collection.update_one(
+                {"_id": ObjectId(album_id)},
+                {"$push": {
+                    "content": {"$each": image_pairs}
+                }})
 
-            # Check if image exists in album
-            if not any(pair.image_id == image_id for pair in album.content):
-                return AlbumOperationResult(status=False, message="Image not in album.")
+            if not result.matched_count:
+                return AlbumOperationResult(status=False, message=f"Fail to access album: {album_id} not exist.")
 
-            await self.collection.update_one(
-                {"_id": ObjectId(album_id)},
+            return AlbumOperationResult(status=True, message=f"{len(image_pairs)} images added to album successfully.")
+        except Exception as e:
+            return AlbumOperationResult(status=False, message=str(e))
+
+    async def deleteImageFromAlbum(self, album_id: str, image_id: str) -> AlbumOperationResult:
+        try:
+            result = await self.collection.update_one(
+                {"_id": ObjectId(album_id), "content.image_id": image_id},
                 {"$pull": {
                     "content": {"image_id": image_id}
                 }}
             )
+
+            if not result.matched_count:
+                if not await self.albumExists(album_id):
+                    return AlbumOperationResult(status=False, message=f"Fail to access album: {album_id} is not exist.")
+                return AlbumOperationResult(status=False, message="Image not in album.")
+
             return AlbumOperationResult(status=True, message="Delete image from album successfully.")
         except Exception as e:
             return AlbumOperationResult(status=False, message=str(e))
 
+    async def albumExists(self, album_id: str) -> bool:
+        return bool(await self.collection.count_documents({"_id": ObjectId(album_id)}, limit=1))
+
+    async def getImagePair(self, album_id: str, image_id: str) -> Optional[ImagePair]:
+        # $elemMatch projection returns only the matching element of the array
+        album = await self.collection.find_one(
+            {"_id": ObjectId(album_id), "content.image_id": image_id},
+            {"content": {"$elemMatch": {"image_id": image_id}}}
+        )
+        if album:
+            return ImagePair(**album["content"][0])
+        return None
+
     async def getAlbumById(self, id: str) -> Optional[Album]:
         album = await self.collection.find_one({"_id": ObjectId(id)})
         if album:
@@ -109,6 +201,20 @@ class AlbumClient(BaseMongoClient):
             return Album(**album)
         return None
 
+    async def getAlbumContent(self, album_id: str, offset: int, limit: int) -> Optional[AlbumContentPage]:
+        """A window of the album's images plus the total count, without loading the whole array."""
+        results = await self.collection.aggregate([
+            {"$match": {"_id": ObjectId(album_id)}},
+            {"$project": {
+                "total": {"$size": "$content"},
+                "items": {"$slice": ["$content", offset, limit]}
+            }}
+        ])
+        album_doc = await anext(results, None)
+        if album_doc is None:
+            return None
+        return AlbumContentPage(album_id=album_id, total=album_doc["total"], offset=offset, items=album_doc["items"])
+
     async def getAllAlbums(self) -> List[Album]:
         albums = []
         cursor = self.collection.find({})
@@ -116,4 +222,266 @@ class AlbumClient(BaseMongoClient):
             if '_id' in album_doc and album_doc['_id'] is not None:
                 album_doc['_id'] = str(album_doc['_id'])
             albums.append(Album(**album_doc))
-        return albums
\ No newline at end of file
+        return albums
+
+    async def listAlbums(self, limit: int, cursor: Optional[str] = None) -> AlbumPage:
+        """One page of album summaries in creation order.
+
+        Keyset pagination on `_id`: ObjectIds grow with insertion time, so the
+        order matches `create_date` and each page is an index range scan no
+        matter how deep it is. Only summary fields leave the server.
+        """
+        pipeline = []
+        if cursor:
+            pipeline.append({"$match": {"_id": {"$gt": ObjectId(cursor)}}})
+        pipeline += [
+            {"$sort": {"_id": 1}},
+            # One extra document tells whether there is a next page
+            {"$limit": limit + 1},
+            {"$project": {
+                "name": 1,
+                "create_date": 1,
+                "image_count": {"$size": "$content"},
+                "cover": {"$arrayElemAt": [{"$slice": ["$content", 1]}, 0]}
+            }},
+            {"$project": {
+                "name": 1,
+                "create_date": 1,
+                "image_count": 1,
+                "cover_thumbnail_id": "$cover.thumbnail_id"
+            }}
+        ]
+
+        items = []
+        results = await self.collection.aggregate(pipeline)
+        async for album_doc in results:
+            album_doc['_id'] = str(album_doc['_id'])
+            items.append(AlbumSummary(**album_doc))
+
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = items[-1].id
+        return AlbumPage(items=items, next_cursor=next_cursor)
+
+
+class MembershipAlbumClient(AlbumClient):
+    """Albums whose images live in the `album_image` collection instead of the `content` array.
+
+    Each membership is one document indexed on (album_id, image_id), so adding,
+    removing and checking an image are single indexed operations and album
+    size is not limited by the 16MB document cap. `content` stays in the album
+    documents as an empty array and is filled from the collection when a
+    whole Album is returned.
+    """
+
+    # Marks the one-time move of embedded `content` arrays into `album_image`
+    MIGRATION_ID = "album_content_to_album_image"
+
+    def __init__(self):
+        super().__init__()
+        self.membership = self.database.get_collection("album_image")
+        self.migrations = self.database.get_collection("migration")
+
+    async def init(self):
+        await super().init()
+        await self.membership.create_index([("album_id", 1), ("image_id", 1)], unique=True)
+        # Serves the album content in insertion order
+        await self.membership.create_index([("album_id", 1), ("_id", 1)])
+
+        # The scan reads every album, only run it until one run has completed
+        if await self.migrations.find_one({"_id": self.MIGRATION_ID}) is None:
+            migrated = await self.migrateEmbeddedContent()
+            await self.migrations.update_one(
+                {"_id": self.MIGRATION_ID}, {"$set": {"completed_at": datetime.now(), "migrated": migrated}}, upsert=True
+            )
+            logger.info(f"Migrated {migrated} images from album content arrays to 'album_image'")
+
+    async def migrateEmbeddedContent(self) -> int:
+        """Move image pairs from `content` arrays into the membership collection.
+
+        Safe to run repeatedly: pairs copied by an interrupted run are skipped by
+        the unique index, and an album's array is only cleared once its pairs are
+        all in the collection.
+        """
+        migrated = 0
+        async for album_doc in self.collection.find({"content.0": {"$exists": True}}, {"content": 1}):
+            # ObjectIds are assigned in list order, which keeps the album order
+            memberships = [
+                {"_id": ObjectId(), "album_id": album_doc["_id"], **ImagePair(**pair).model_dump()}
+                for pair in album_doc["content"]
+            ]
+            try:
+                await self.membership.insert_many(memberships, ordered=False)
+            except BulkWriteError as e:
+                if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                    raise
+
+            await self.collection.update_one({"_id": album_doc["_id"]}, {"$set": {"content": []}})
+            migrated += len(memberships)
+        return migrated
+
+    async def deleteAlbumByName(self, name: str) -> AlbumOperationResult:
+        try:
+            album_doc = await self.collection.find_one_and_delete({"name": name}, {"_id": 1})
+            if album_doc is None:
+                return AlbumOperationResult(status=False, message="Album name does not exist.")
+
+            await self.membership.delete_many({"album_id": album_doc["_id"]})
+            return AlbumOperationResult(status=True, message="Album delete successfully.")
+        except Exception as e:
+            return AlbumOperationResult(status=False, message=str(e))
+
+    async def deleteAlbumById(self, album_id: str) -> Optional[List[ImagePair]]:
+        album_doc = await self.collection.find_one_and_delete({"_id": ObjectId(album_id)}, {"_id": 1})
+        if album_doc is None:
+            return None
+
+        # Read once the album is gone, so an image added until then is included. Only the rows
+        # read are deleted: one inserted later is removed by addImageToAlbum, which sees no album.
+        memberships = await self.membership.find({"album_id": album_doc["_id"]}).sort("_id", 1).to_list()
+        await self.membership.delete_many({"_id": {"$in": [membership["_id"] for membership in memberships]}})
+        return [ImagePair(**membership) for membership in memberships]
+
+    async def addImageToAlbum(self, album_id: str, image_id: str, thumbnail_id: str) -> AlbumOperationResult:
+        try:
+            image_pair = ImagePair(image_id=image_id, thumbnail_id=thumbnail_id)
+            membership = {"_id": ObjectId(), "album_id": ObjectId(album_id), **image_pair.model_dump()}
+            try:
+                # The unique index rejects duplicates
+                await self.membership.insert_one(membership)
+            except DuplicateKeyError:
+                return AlbumOperationResult(status=False, message="Image already in album.")
+
+            if not await self._keepMemberships(album_id, [membership["_id"]], 1):
+                return AlbumOperationResult(status=False, message=f"Fail to access album: {album_id} not exist.")
+
+            return AlbumOperationResult(status=True, message=f"Image {image_id} added to album successfully.")
+        except Exception as e:
+            return AlbumOperationResult(status=False, message=str(e))
+
+    async def addImagesToAlbum(self, album_id: str, pairs: List[tuple[str, str]]) -> AlbumOperationResult:
+        try:
+            memberships = [
+                {"_id": ObjectId(), "album_id": ObjectId(album_id), **ImagePair(image_id=image_id, thumbnail_id=thumbnail_id).model_dump()}
+                for image_id, thumbnail_id in pairs
+            ]
+            membership_ids = [membership["_id"] for membership in memberships]
+            try:
+                result = await self.membership.insert_many(memberships, ordered=False)
+                added = len(result.inserted_ids)
+            except BulkWriteError as e:
+                if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                    # The caller releases every image of a failed update, none may stay in the album
+                    await self.membership.delete_many({"_id": {"$in": membership_ids}})
+                    raise
+                # Duplicates are skipped, the rest of the batch is still inserted
+                added = e.details.get("nInserted", 0)
+
+            if not await self._keepMemberships(album_id, membership_ids, added):
+                return AlbumOperationResult(status=False, message=f"Fail to access album: {album_id} not exist.")
+
+            return AlbumOperationResult(status=True, message=f"{added} images added to album successfully.")
+        except Exception as e:
+            return AlbumOperationResult(status=False, message=str(e))
+
+    async def _keepMemberships(self, album_id: str, membership_ids: List[ObjectId], added: int) -> bool:
+        """Whether the `added` memberships just inserted stay in the album.
+
+        The album is checked after the insert, so a racing deleteAlbumById either reads
+        the memberships or has already deleted the album. When the album is gone they are
+        removed again, unless deleteAlbumById took them: those images are released with
+        the album, so they count as added.
+        """
+        if await self.albumExists(album_id):
+            return True
+        result = await self.membership.delete_many({"_id": {"$in": membership_ids}})
+        if 0 < result.deleted_count < added:
+            # Reporting a failure would release the images the album deletion took a second time
+            logger.warning(f"Album {album_id} was deleted while adding images, {result.deleted_count} of them keep a reference")
+        return result.deleted_count < added
+
+    async def deleteImageFromAlbum(self, album_id: str, image_id: str) -> AlbumOperationResult:
+        try:
+            result = await self.membership.delete_one({"album_id": ObjectId(album_id), "image_id": image_id})
+            if not result.deleted_count:
+                return AlbumOperationResult(status=False, message="Image not in album.")
+
+            return AlbumOperationResult(status=True, message="Delete image from album successfully.")
+        except Exception as e:
+            return AlbumOperationResult(status=False, message=str(e))
+
+    async def getImagePair(self, album_id: str, image_id: str) -> Optional[ImagePair]:
+        membership = await self.membership.find_one({"album_id": ObjectId(album_id), "image_id": image_id})
+        if membership:
+            return ImagePair(**membership)
+        return None
+
+    async def getAlbumById(self, id: str) -> Optional[Album]:
+        return await self._getAlbum({"_id": ObjectId(id)})
+
+    async def getAlbumByName(self, name: str) -> Optional[Album]:
+        return await self._getAlbum({"name": name})
+
+    async def getAllAlbums(self) -> List[Album]:
+        albums = []
+        async for album_doc in self.collection.find({}, {"content": 0}):
+            albums.append(await self._withContent(album_doc))
+        return albums
+
+    async def getAlbumContent(self, album_id: str, offset: int, limit: int) -> Optional[AlbumContentPage]:
+        album_filter = {"album_id": ObjectId(album_id)}
+        exists, total, memberships = await asyncio.gather(
+            self.albumExists(album_id),
+            self.membership.count_documents(album_filter),
+            self.membership.find(album_filter).sort("_id", 1).skip(offset).limit(limit).to_list()
+        )
+        if not exists:
+            return None
+        items = [ImagePair(**membership) for membership in memberships]
+        return AlbumContentPage(album_id=album_id, total=total, offset=offset, items=items)
+
+    async def listAlbums(self, limit: int, cursor: Optional[str] = None) -> AlbumPage:
+        album_filter = {"_id": {"$gt": ObjectId(cursor)}} if cursor else {}
+        album_docs = await self.collection.find(album_filter, {"name": 1, "create_date": 1}).sort("_id", 1).limit(limit + 1).to_list()
+
+        next_cursor = None
+        if len(album_docs) > limit:
+            album_docs = album_docs[:limit]
+            next_cursor = str(album_docs[-1]["_id"])
+
+        # Counts and covers for the whole page in one indexed aggregation
+        results = await self.membership.aggregate([
+            {"$match": {"album_id": {"$in": [album_doc["_id"] for album_doc in album_docs]}}},
+            {"$sort": {"album_id": 1, "_id": 1}},
+            {"$group": {
+                "_id": "$album_id",
+                "image_count": {"$sum": 1},
+                "cover_thumbnail_id": {"$first": "$thumbnail_id"}
+            }}
+        ])
+        summaries = {summary["_id"]: summary async for summary in results}
+
+        items = []
+        for album_doc in album_docs:
+            summary = summaries.get(album_doc["_id"], {})
+            items.append(AlbumSummary(
+                id=str(album_doc["_id"]),
+                name=album_doc["name"],
+                create_date=album_doc["create_date"],
+                image_count=summary.get("image_count", 0),
+                cover_thumbnail_id=summary.get("cover_thumbnail_id")
+            ))
+        return AlbumPage(items=items, next_cursor=next_cursor)
+
+    async def _getAlbum(self, album_filter: dict) -> Optional[Album]:
+        album_doc = await self.collection.find_one(album_filter, {"content": 0})
+        if album_doc:
+            return await self._withContent(album_doc)
+        return None
+
+    async def _withContent(self, album_doc: dict) -> Album:
+        memberships = await self.membership.find({"album_id": album_doc["_id"]}).sort("_id", 1).to_list()
+        album_doc["_id"] = str(album_doc["_id"])
+        album_doc["content"] = [ImagePair(**membership) for membership in memberships]
+        return Album(**album_doc)
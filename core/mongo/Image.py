@@ -1,15 +1,24 @@
+from core.helper.cache import ByteLRUCache
+from core.models.album import ImagePair
+from core.models.image import StoredFile
 from core.mongo.mongo import BaseMongoClient
-from pymongo.errors import CollectionInvalid
-from typing import Optional
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+from typing import Awaitable, Callable, Optional
 from bson import ObjectId
+import asyncio
+from datetime import datetime, timezone
+from io import BytesIO
 import logging
-import os
 
 logger = logging.getLogger(__name__)
 
 class ImageClient(BaseMongoClient):
-    def __init__(self):
+    def __init__(self, cache: Optional[ByteLRUCache[StoredFile]] = None):
         super().__init__(db_name="album", coll_name="image")
+        # Files are immutable, the cache only has to drop entries on delete
+        self.cache = cache
+        # Content hash of each upload -> its converted files, with the number of album references
+        self.hashes = self.database.get_collection("image_hash")
 
     async def init(self):
         try:
@@ -23,54 +32,249 @@ class ImageClient(BaseMongoClient):
             logger.error(f"Failed to create 'image' collection: {e}")
             raise
 
+        await self.hashes.create_index("image_id", unique=True)
+        # Renditions are looked up, and deleted, by the file they were made from
+        await self.database.get_collection("image_bucket.files").create_index(
+            [("metadata.source_id", 1), ("metadata.width", 1)], sparse=True
+        )
+
         self.init_bucket()
         logger.info("Initialized GridFS bucket for images")
 
-    async def uploadFileToBucket(self, file_path: str, filename: str) -> str:
+    async def uploadBytesToBucket(self, data: bytes, filename: str, file_id: Optional[ObjectId] = None,
+                                  metadata: Optional[dict] = None) -> str:
         try:
-            if not os.path.exists(file_path):
-                raise FileNotFoundError(f"File not found: {file_path}")
-
             logger.info(f"Starting uploading {filename}")
 
-            with open(file_path, 'rb') as f:
-                file_id = await self.gridfs_bucket.upload_from_stream(
-                    filename,
-                    f,
-                    metadata={"content_type": "image/webp"}
-                )
+            file_id = file_id or ObjectId()
+            await self.gridfs_bucket.upload_from_stream_with_id(
+                file_id,
+                filename,
+                BytesIO(data),
+                metadata={"content_type": "image/webp", **(metadata or {})}
+            )
 
             logger.info("Upload success")
-            
+
             return str(file_id)
         except Exception as e:
             logger.error(f"Upload failed {filename}")
             raise
 
     async def getFileFromBucket(self, file_id: str):
+        stored = await self.getStoredFileFromBucket(file_id)
+        return stored.contents if stored else None
+
+    async def getStoredFileFromBucket(self, file_id: str) -> Optional[StoredFile]:
+        stored = await self.openFileFromBucket(file_id)
+        if stored is None:
+            return None
+        if stored.contents is None:
+            try:
+                stored.contents = await stored.stream.read()
+            finally:
+                await stored.stream.close()
+            stored.stream = None
+        return stored
+
+    async def openFileFromBucket(self, file_id: str) -> Optional[StoredFile]:
+        """Look up a file for download.
+
+        Cached files, and files small enough to be cached, come back with their
+        `contents`. Anything larger comes back with an open `stream` to be read
+        with iterFileChunks so it never has to be held in memory at once.
+        """
+        if self.cache is not None:
+            stored = self.cache.get(file_id)
+            if stored is not None:
+                return stored
+
         try:
-            from bson import ObjectId
             logger.info(f"file id: {file_id}")
 
             grid_out = await self.gridfs_bucket.open_download_stream(ObjectId(file_id))
 
-            contents = await grid_out.read()
+            stored = StoredFile(
+                id=file_id,
+                length=grid_out.length,
+                content_type=(grid_out.metadata or {}).get("content_type", "image/webp"),
+                # GridFS stores UTC, the driver returns naive datetimes
+                upload_date=grid_out.upload_date.replace(tzinfo=timezone.utc),
+                stream=grid_out
+            )
+
+            if self.cache is not None and stored.length <= self.cache.max_item_bytes:
+                try:
+                    stored.contents = await grid_out.read()
+                finally:
+                    await grid_out.close()
+                stored.stream = None
+                self.cache.put(file_id, stored, stored.length)
 
             logger.info(f"Get File successfully: {file_id}")
-            return contents
+            return stored
 
         except Exception as e:
             logger.info(e)
             return None
 
+    async def iterFileChunks(self, stored: StoredFile, start: int = 0, end: Optional[int] = None):
+        """Yield bytes `start` to `end` (inclusive) of a file from openFileFromBucket, one GridFS chunk at a time."""
+        end = stored.length - 1 if end is None else end
+        if stored.contents is not None:
+            yield stored.contents[start:end + 1]
+            return
+
+        grid_out = stored.stream
+        try:
+            await grid_out.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await grid_out.readchunk()
+                if not chunk:
+                    break
+                yield chunk[:remaining]
+                remaining -= len(chunk)
+        finally:
+            await grid_out.close()
+
+    async def closeFile(self, stored: StoredFile):
+        """Close the download stream of a file from openFileFromBucket, if it has one. Safe to repeat."""
+        if stored.stream is not None:
+            await stored.stream.close()
+
     async def deleteFileFromBucket(self, file_id: str) -> bool:
+        if self.cache is not None:
+            self.cache.invalidate(file_id)
         try:
+            await self.deleteFilesFromBucket(await self.findRenditionIds([file_id]))
             await self.gridfs_bucket.delete(ObjectId(file_id))
             return True
         except Exception as e:
             logger.info(f"fail to delete file in bucket: {e}")
             return False
 
+    async def deleteFilesFromBucket(self, file_ids: list[str], batch_size: int = 500,
+                                    on_progress: Optional[Callable[[int, int], Awaitable]] = None) -> int:
+        """Delete many GridFS files, and their renditions, with one delete_many per batch
+        on the files and chunks collections.
+
+        Returns the number of file documents deleted. `on_progress` receives the running
+        total and the number of files to delete, renditions included, first before any batch.
+        """
+        files = self.database.get_collection("image_bucket.files")
+        chunks = self.database.get_collection("image_bucket.chunks")
+        file_ids = file_ids + await self.findRenditionIds(file_ids)
+
+        deleted = 0
+        if on_progress:
+            await on_progress(deleted, len(file_ids))
+        for start in range(0, len(file_ids), batch_size):
+            batch = file_ids[start:start + batch_size]
+            if self.cache is not None:
+                for file_id in batch:
+                    self.cache.invalidate(file_id)
+
+            object_ids = [ObjectId(file_id) for file_id in batch]
+            files_result, _ = await asyncio.gather(
+                files.delete_many({"_id": {"$in": object_ids}}),
+                chunks.delete_many({"files_id": {"$in": object_ids}})
+            )
+            deleted += files_result.deleted_count
+            if on_progress:
+                await on_progress(deleted, len(file_ids))
+
+        return deleted
+
+    async def retainImageByHash(self, content_hash: str) -> Optional[ImagePair]:
+        """The files converted from `content_hash`, counting one more reference to them.
+
+        The lookup and the count are one atomic update, so the files cannot be released
+        and deleted in between. A record whose count already dropped to zero is being
+        deleted and is not returned. The caller adds the image to an album or gives the
+        reference back with `releaseImages`.
+        """
+        doc = await self.hashes.find_one_and_update(
+            {"_id": content_hash, "refcount": {"$gt": 0}},
+            {"$inc": {"refcount": 1}}
+        )
+        if doc is None:
+            return None
+        return ImagePair(image_id=doc["image_id"], thumbnail_id=doc["thumbnail_id"])
+
+    async def registerImageHash(self, content_hash: str, image_id: str, thumbnail_id: str) -> ImagePair:
+        """Record the files converted from `content_hash`, with one reference held by the caller.
+
+        If a concurrent upload of the same content registered first, a reference to its
+        pair is taken and that pair is returned instead; the caller should discard its own
+        files. Should that record be in the middle of its release, the caller's files are
+        returned unregistered.
+        """
+        try:
+            await self.hashes.insert_one({
+                "_id": content_hash,
+                "image_id": image_id,
+                "thumbnail_id": thumbnail_id,
+                "refcount": 1,
+                "create_date": datetime.now()
+            })
+        except DuplicateKeyError:
+            existing = await self.retainImageByHash(content_hash)
+            if existing is not None:
+                return existing
+        return ImagePair(image_id=image_id, thumbnail_id=thumbnail_id)
+
+    async def releaseImages(self, image_ids: list[str]) -> list[str]:
+        """Drop one reference from each image and return the ids whose files can be deleted.
+
+        Images without a hash record were never shared, so they are always returned.
+        Each id should appear once, the same record is only decremented once per call.
+        """
+        if not image_ids:
+            return []
+
+        await self.hashes.update_many({"image_id": {"$in": image_ids}}, {"$inc": {"refcount": -1}})
+
+        shared = set()
+        unreferenced = []
+        async for doc in self.hashes.find({"image_id": {"$in": image_ids}}, {"image_id": 1, "refcount": 1}):
+            if doc["refcount"] > 0:
+                shared.add(doc["image_id"])
+            else:
+                unreferenced.append(doc)
+
+        # Conditional deletes, a record is only removed while no reference is left
+        results = await asyncio.gather(*(
+            self.hashes.delete_one({"_id": doc["_id"], "refcount": {"$lte": 0}}) for doc in unreferenced
+        ))
+        for doc, result in zip(unreferenced, results):
+            if not result.deleted_count:
+                shared.add(doc["image_id"])
+
+        return [image_id for image_id in image_ids if image_id not in shared]
+
+    async def findRendition(self, source_id: str, width: Optional[int], format: str = "webp") -> Optional[str]:
+        files = self.database.get_collection("image_bucket.files")
+        # Renditions made before AVIF support have no format, they are all WebP
+        formats = [format, None] if format == "webp" else [format]
+        # Oldest first, in case two processes generated the same rendition
+        doc = await files.find_one(
+            {"metadata.source_id": source_id, "metadata.width": width, "metadata.format": {"$in": formats}},
+            {"_id": 1},
+            sort=[("_id", 1)]
+        )
+        return str(doc["_id"]) if doc else None
+
+    async def findRenditionIds(self, source_ids: list[str]) -> list[str]:
+        if not source_ids:
+            return []
+        files = self.database.get_collection("image_bucket.files")
+        cursor = files.find({"metadata.source_id": {"$in": source_ids}}, {"_id": 1})
+        return [str(doc["_id"]) async for doc in cursor]
+
+    def cache_stats(self) -> Optional[dict]:
+        return self.cache.stats() if self.cache is not None else None
+
     async def findThumbnailByMainId(self, main_image_id: str) -> Optional[str]:
         try:
             cursor = self.gridfs_bucket.find({"filename": f"thumbnail_{main_image_id}.webp"})
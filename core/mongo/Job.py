@@ -0,0 +1,55 @@
+from core.helper.converter import AlbumDeleteJob, Job, JobGroup
+from core.helper.job_store import JobStore
+from core.mongo.mongo import BaseMongoClient
+from dataclasses import asdict
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+RECORD_TYPES = {cls.__name__: cls for cls in (Job, AlbumDeleteJob, JobGroup)}
+
+def _document_factory(items: list[tuple[str, Any]]) -> dict:
+    return {key: value.value if isinstance(value, Enum) else value for key, value in items}
+
+class MongoJobStore(BaseMongoClient, JobStore):
+    """Job records shared by every worker process and kept across restarts.
+
+    Each save refreshes `expire_at`, and a TTL index lets MongoDB remove records
+    `ttl_seconds` after their last update, so `cleanup` has nothing to do.
+    """
+
+    def __init__(self, ttl_seconds: int = 3600):
+        super().__init__(db_name="album", coll_name="job")
+        self.ttl_seconds = ttl_seconds
+
+    async def init(self):
+        await self.collection.create_index("expire_at", expireAfterSeconds=0)
+
+    async def save(self, record: Any):
+        doc = asdict(record, dict_factory=_document_factory)
+        doc["kind"] = type(record).__name__
+        doc["expire_at"] = datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+        await self.collection.replace_one({"_id": record.id}, doc, upsert=True)
+
+    async def get(self, record_id: str) -> Optional[Any]:
+        doc = await self.collection.find_one({"_id": record_id})
+        return self._toRecord(doc) if doc else None
+
+    async def get_many(self, record_ids: list[str]) -> list[Any]:
+        docs = {doc["_id"]: doc async for doc in self.collection.find({"_id": {"$in": record_ids}})}
+        records = [self._toRecord(docs[record_id]) for record_id in record_ids if record_id in docs]
+        return [record for record in records if record is not None]
+
+    async def delete(self, record_id: str) -> bool:
+        result = await self.collection.delete_one({"_id": record_id})
+        return result.deleted_count > 0
+
+    def _toRecord(self, doc: dict) -> Optional[Any]:
+        record_type = RECORD_TYPES.get(doc.get("kind"))
+        if record_type is None:
+            logger.warning(f"Unknown job record kind: {doc.get('kind')}")
+            return None
+        return record_type.from_dict({key: value for key, value in doc.items() if key not in ("_id", "kind", "expire_at")})
@@ -1,4 +1,5 @@
 from pymongo.asynchronous.mongo_client import AsyncMongoClient
+from core.mongo.monitoring import COMMAND_METRICS
 from gridfs import AsyncGridFSBucket
 from dotenv import load_dotenv
 import os
@@ -8,7 +9,7 @@ load_dotenv()
 class BaseMongoClient:
     def __init__(self, db_name: str, coll_name: str):
         self.uri = f"{os.getenv("MONGO_DB_HOST")}:{os.getenv("MONGO_DB_PORT")}"
-        self.client = AsyncMongoClient(f"mongodb://{self.uri}")
+        self.client = AsyncMongoClient(f"mongodb://{self.uri}", event_listeners=[COMMAND_METRICS])
         self.database = self.client.get_database(db_name)
         self.collection = self.database.get_collection(coll_name)
         self.gridfs_bucket = None
@@ -0,0 +1,37 @@
+from core.helper import metrics
+from pymongo import monitoring
+import threading
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Records the duration of every MongoDB command by command and collection.
+
+    The driver only names the collection when a command starts, so it is kept by
+    request until the command succeeds or fails.
+    """
+
+    def __init__(self):
+        self.collections: dict[tuple, str] = {}
+        self.lock = threading.Lock()
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        # e.g. {"find": "album", ...}; getMore names the collection separately
+        target = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+        with self.lock:
+            self.collections[(event.connection_id, event.request_id)] = target if isinstance(target, str) else ""
+
+    def _collection(self, event) -> str:
+        with self.lock:
+            return self.collections.pop((event.connection_id, event.request_id), "")
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        metrics.MONGO_COMMAND_SECONDS.labels(event.command_name, self._collection(event)).observe(event.duration_micros / 1_000_000)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        collection = self._collection(event)
+        metrics.MONGO_COMMAND_SECONDS.labels(event.command_name, collection).observe(event.duration_micros / 1_000_000)
+        metrics.MONGO_COMMAND_FAILURES.labels(event.command_name, collection).inc()
+
+
+# Shared by every client so each command is recorded once
+COMMAND_METRICS = CommandMetricsListener()
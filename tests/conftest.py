@@ -0,0 +1,15 @@
+from bench.standin import memory_mongo
+import pytest
+
+
+@pytest.fixture
+def anyio_backend():
+    # The app runs on asyncio only
+    return "asyncio"
+
+
+@pytest.fixture
+def mongo():
+    """A fresh in-memory MongoDB for every Mongo client created during the test."""
+    with memory_mongo() as client:
+        yield client
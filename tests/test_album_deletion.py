@@ -0,0 +1,48 @@
+from core.mongo.Album import AlbumClient, MembershipAlbumClient
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(params=[AlbumClient, MembershipAlbumClient])
+async def client(request, mongo):
+    client = request.param()
+    await client.init()
+    yield client
+    await client.close()
+
+
+async def test_pending_deletion_gets_images_added_after_the_album_was_read(client):
+    album_id = (await client.createAlbum("album")).message
+    for n in range(2):
+        await client.addImageToAlbum(album_id, f"image-{n}", f"thumb-{n}")
+
+    album = await client.getAlbumById(album_id)
+    assert await client.addPendingDeletion(album.id, album.content)
+    # Added between the read and the deletion
+    await client.addImageToAlbum(album_id, "image-2", "thumb-2")
+
+    content = await client.deleteAlbumById(album_id)
+    assert [pair.image_id for pair in content] == ["image-0", "image-1", "image-2"]
+    await client.setPendingDeletionContent(album_id, content)
+
+    claimed = await client.claimPendingRelease(album_id)
+    assert [pair.image_id for pair in claimed] == ["image-0", "image-1", "image-2"]
+    assert not await client.albumExists(album_id)
+
+
+async def test_deleting_a_missing_album_returns_none(client):
+    album_id = (await client.createAlbum("album")).message
+    assert await client.deleteAlbumById(album_id) is not None
+    assert await client.deleteAlbumById(album_id) is None
+
+
+async def test_memberships_are_deleted_with_the_album(mongo):
+    client = MembershipAlbumClient()
+    await client.init()
+    album_id = (await client.createAlbum("album")).message
+    await client.addImageToAlbum(album_id, "image-0", "thumb-0")
+
+    await client.deleteAlbumById(album_id)
+    assert await client.membership.count_documents({}) == 0
+    await client.close()
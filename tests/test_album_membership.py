@@ -0,0 +1,87 @@
+from bson import ObjectId
+from core.mongo.Album import MembershipAlbumClient
+from pymongo.errors import BulkWriteError
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def client(mongo):
+    client = MembershipAlbumClient()
+    await client.init()
+    yield client
+    await client.close()
+
+
+def delete_album_after_insert(client: MembershipAlbumClient, album_id: str, delete):
+    """Make the next insert of a membership race with a deletion of the album."""
+    insert_one = client.membership.insert_one
+
+    async def racing_insert_one(*args, **kwargs):
+        result = await insert_one(*args, **kwargs)
+        client.membership.insert_one = insert_one
+        await delete(album_id)
+        return result
+
+    client.membership.insert_one = racing_insert_one
+
+
+async def test_adding_to_a_missing_album_leaves_no_membership(client):
+    album_id = (await client.createAlbum("album")).message
+    await client.deleteAlbumById(album_id)
+
+    result = await client.addImageToAlbum(album_id, "image-0", "thumb-0")
+    assert not result.status
+    assert await client.membership.count_documents({}) == 0
+
+
+async def test_membership_inserted_after_the_album_deletion_is_removed(client):
+    album_id = (await client.createAlbum("album")).message
+    # The album is gone, but no deletion read the memberships
+    delete_album_after_insert(client, album_id, lambda album_id: client.collection.delete_one({"_id": ObjectId(album_id)}))
+
+    result = await client.addImageToAlbum(album_id, "image-0", "thumb-0")
+    assert not result.status
+    assert await client.membership.count_documents({}) == 0
+
+
+async def test_membership_taken_by_the_album_deletion_counts_as_added(client):
+    album_id = (await client.createAlbum("album")).message
+    deleted = []
+
+    async def delete(album_id):
+        deleted.extend(await client.deleteAlbumById(album_id))
+
+    delete_album_after_insert(client, album_id, delete)
+
+    # The deletion releases the image, the caller must not release it too
+    result = await client.addImageToAlbum(album_id, "image-0", "thumb-0")
+    assert result.status
+    assert [pair.image_id for pair in deleted] == ["image-0"]
+    assert await client.membership.count_documents({}) == 0
+
+
+async def test_batch_skips_images_already_in_album(client):
+    album_id = (await client.createAlbum("album")).message
+    await client.addImageToAlbum(album_id, "image-0", "thumb-0")
+
+    result = await client.addImagesToAlbum(album_id, [("image-0", "thumb-0"), ("image-1", "thumb-1")])
+    assert result.status
+    assert (await client.getAlbumContent(album_id, 0, 10)).total == 2
+
+
+async def test_batch_fails_on_other_write_errors(client):
+    album_id = (await client.createAlbum("album")).message
+    insert_many = client.membership.insert_many
+
+    async def failing_insert_many(memberships, **kwargs):
+        await insert_many(memberships[:1], **kwargs)
+        raise BulkWriteError({"writeErrors": [{"index": 1, "code": 121, "errmsg": "Document failed validation"}], "nInserted": 1})
+
+    client.membership.insert_many = failing_insert_many
+
+    result = await client.addImagesToAlbum(album_id, [("image-0", "thumb-0"), ("image-1", "thumb-1")])
+    assert not result.status
+    # The caller releases both images, neither may stay in the album
+    assert await client.membership.count_documents({}) == 0
@@ -0,0 +1,74 @@
+from core.mongo.Album import AlbumClient, MembershipAlbumClient
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def embedded_album(name: str, image_count: int) -> str:
+    client = AlbumClient()
+    await client.init()
+    album_id = (await client.createAlbum(name)).message
+    for n in range(image_count):
+        await client.addImageToAlbum(album_id, f"{name}-image-{n}", f"{name}-thumb-{n}")
+    await client.close()
+    return album_id
+
+
+@pytest.fixture
+async def album_ids(mongo):
+    return [await embedded_album("first", 3), await embedded_album("second", 2)]
+
+
+async def test_migration_moves_content_in_album_order(album_ids):
+    client = MembershipAlbumClient()
+    await client.init()
+
+    first = await client.getAlbumById(album_ids[0])
+    assert [pair.image_id for pair in first.content] == ["first-image-0", "first-image-1", "first-image-2"]
+    page = await client.getAlbumContent(album_ids[1], 0, 10)
+    assert page.total == 2
+    assert [pair.thumbnail_id for pair in page.items] == ["second-thumb-0", "second-thumb-1"]
+
+    # Content arrays are emptied once their pairs are in the collection
+    assert await client.collection.count_documents({"content.0": {"$exists": True}}) == 0
+    await client.close()
+
+
+async def test_migration_skips_pairs_already_copied(album_ids):
+    client = MembershipAlbumClient()
+    # An interrupted run copied a pair without clearing the array
+    await client.membership.create_index([("album_id", 1), ("image_id", 1)], unique=True)
+    album = await client.collection.find_one({"name": "first"})
+    await client.membership.insert_one({"album_id": album["_id"], **album["content"][0]})
+
+    assert await client.migrateEmbeddedContent() == 5
+    assert await client.membership.count_documents({}) == 5
+    await client.close()
+
+
+async def test_migration_runs_once(album_ids):
+    client = MembershipAlbumClient()
+    await client.init()
+    marker = await client.migrations.find_one({"_id": MembershipAlbumClient.MIGRATION_ID})
+    assert marker["migrated"] == 5
+
+    # Content written by an embedded client afterwards is not picked up again
+    await AlbumClient().collection.update_one({"name": "first"}, {"$push": {"content": {"image_id": "late", "thumbnail_id": "late"}}})
+    await client.init()
+    assert await client.getImagePair(album_ids[0], "late") is None
+    await client.close()
+
+
+async def test_add_image_checks_the_album_first(mongo):
+    client = MembershipAlbumClient()
+    await client.init()
+    album_id = (await client.createAlbum("album")).message
+
+    assert (await client.addImageToAlbum(album_id, "image", "thumb")).status
+    duplicate = await client.addImageToAlbum(album_id, "image", "thumb")
+    assert not duplicate.status and duplicate.message == "Image already in album."
+
+    missing = await client.addImageToAlbum("0" * 24, "image", "thumb")
+    assert not missing.status
+    assert await client.membership.count_documents({}) == 1
+    await client.close()
@@ -0,0 +1,74 @@
+from core.mongo.Image import ImageClient
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def image_client(mongo):
+    client = ImageClient()
+    await client.init()
+    yield client
+    await client.close()
+
+
+async def refcount(image_client: ImageClient, content_hash: str):
+    doc = await image_client.hashes.find_one({"_id": content_hash})
+    return None if doc is None else doc["refcount"]
+
+
+async def test_register_holds_one_reference(image_client):
+    pair = await image_client.registerImageHash("hash", "main", "thumb")
+
+    assert (pair.image_id, pair.thumbnail_id) == ("main", "thumb")
+    assert await refcount(image_client, "hash") == 1
+
+
+async def test_retain_by_hash_counts_a_reference(image_client):
+    await image_client.registerImageHash("hash", "main", "thumb")
+
+    pair = await image_client.retainImageByHash("hash")
+    assert pair.image_id == "main"
+    assert await refcount(image_client, "hash") == 2
+    assert await image_client.retainImageByHash("unknown") is None
+
+
+async def test_concurrent_register_returns_the_first_pair(image_client):
+    await image_client.registerImageHash("hash", "main", "thumb")
+
+    pair = await image_client.registerImageHash("hash", "other-main", "other-thumb")
+    assert pair.image_id == "main"
+    assert await refcount(image_client, "hash") == 2
+
+
+async def test_files_are_deletable_after_the_last_release(image_client):
+    await image_client.registerImageHash("hash", "main", "thumb")
+    await image_client.retainImageByHash("hash")
+
+    assert await image_client.releaseImages(["main"]) == []
+    assert await refcount(image_client, "hash") == 1
+
+    assert await image_client.releaseImages(["main"]) == ["main"]
+    assert await refcount(image_client, "hash") is None
+
+
+async def test_released_images_cannot_be_retained(image_client):
+    await image_client.registerImageHash("hash", "main", "thumb")
+    await image_client.releaseImages(["main"])
+
+    assert await image_client.retainImageByHash("hash") is None
+
+
+async def test_record_at_zero_is_not_retained(image_client):
+    # The state between the decrement and the delete of a concurrent release
+    await image_client.hashes.insert_one({"_id": "hash", "image_id": "main", "thumbnail_id": "thumb", "refcount": 0})
+
+    assert await image_client.retainImageByHash("hash") is None
+    assert await refcount(image_client, "hash") == 0
+
+
+async def test_images_without_hash_record_are_always_deletable(image_client):
+    await image_client.registerImageHash("hash", "main", "thumb")
+
+    assert await image_client.releaseImages(["unregistered", "main"]) == ["unregistered", "main"]
+    assert await image_client.releaseImages([]) == []
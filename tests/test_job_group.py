@@ -0,0 +1,80 @@
+from bench.stubs import StubImageClient
+from core.helper.converter import Converter, Status
+from core.models.album import AlbumOperationResult
+from io import BytesIO
+from PIL import Image
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeAlbumClient:
+    def __init__(self, status: bool = True):
+        self.status = status
+        self.added = []
+
+    async def addImagesToAlbum(self, album_id: str, pairs: list[tuple[str, str]]) -> AlbumOperationResult:
+        if self.status:
+            self.added.extend(pairs)
+        return AlbumOperationResult(status=self.status, message="added" if self.status else "Album not found")
+
+    async def getImagePair(self, album_id: str, image_id: str):
+        return None
+
+
+def image() -> BytesIO:
+    buffer = BytesIO()
+    Image.new("RGB", (64, 48), (200, 30, 30)).save(buffer, "PNG")
+    buffer.seek(0)
+    return buffer
+
+
+def not_an_image() -> BytesIO:
+    return BytesIO(b"not an image")
+
+
+async def run_batch(sources: list[BytesIO], album_client: FakeAlbumClient):
+    converter = Converter(image_client=StubImageClient())
+    try:
+        group = await converter.submit_batch(
+            [(source, f"file{n}.png", None) for n, source in enumerate(sources)], "album", album_client
+        )
+        await converter.queue.join()
+        group = await converter.getGroup(group.id)
+        return group.to_response(await converter.getGroupJobs(group))
+    finally:
+        await converter.shutdown()
+
+
+async def test_group_succeeds_when_every_job_is_added():
+    album_client = FakeAlbumClient()
+    response = await run_batch([image(), image()], album_client)
+
+    assert response["overall_status"] == Status.SUCCESS.name
+    assert response["progress"]["succeeded"] == 2
+    assert len(album_client.added) == 2
+
+
+async def test_group_fails_when_no_job_converts():
+    album_client = FakeAlbumClient()
+    response = await run_batch([not_an_image(), not_an_image()], album_client)
+
+    assert response["overall_status"] == Status.FAILED.name
+    assert response["progress"]["failed"] == 2
+    assert album_client.added == []
+
+
+async def test_group_is_partial_when_some_jobs_fail():
+    album_client = FakeAlbumClient()
+    response = await run_batch([image(), not_an_image()], album_client)
+
+    assert response["overall_status"] == Status.PARTIAL.name
+    assert response["album_association"]["associated"]
+    assert len(album_client.added) == 1
+
+
+async def test_group_fails_when_the_album_update_fails():
+    response = await run_batch([image()], FakeAlbumClient(status=False))
+
+    assert response["overall_status"] == Status.FAILED.name
+    assert not response["album_association"]["associated"]
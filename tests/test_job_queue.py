@@ -0,0 +1,72 @@
+from core.helper.job_queue import BatchTooLargeError, FairJobQueue, QueueFullError
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_rejects_beyond_max_depth():
+    queue = FairJobQueue(max_depth=2, concurrency=1)
+    queue.put_nowait("a", 1)
+    queue.put_nowait("b", 2)
+
+    with pytest.raises(QueueFullError):
+        queue.put_nowait("a", 3)
+    assert len(queue) == 2
+    assert queue.stats()["accepted_total"] == 2
+    assert queue.stats()["rejected_total"] == 1
+
+
+async def test_batches_are_admitted_as_a_whole():
+    queue = FairJobQueue(max_depth=3, concurrency=1)
+    queue.put_nowait("a", 1)
+
+    queue.check_capacity(2)
+    with pytest.raises(QueueFullError):
+        queue.check_capacity(3)
+
+
+async def test_batches_larger_than_the_queue_are_never_admitted():
+    queue = FairJobQueue(max_depth=3, concurrency=1)
+
+    with pytest.raises(BatchTooLargeError) as error:
+        queue.check_capacity(4)
+    assert error.value.max_size == 3
+    assert queue.stats()["rejected_total"] == 0
+
+
+async def test_albums_are_served_round_robin():
+    queue = FairJobQueue(max_depth=10, concurrency=1)
+    for item in ("a1", "a2", "a3"):
+        queue.put_nowait("a", item)
+    queue.put_nowait("b", "b1")
+
+    assert [await queue.get() for _ in range(4)] == ["a1", "b1", "a2", "a3"]
+
+
+async def test_retry_after_starts_from_the_expected_service_time():
+    queue = FairJobQueue(max_depth=4, concurrency=2, expected_service_seconds=3.0)
+    for item in range(4):
+        queue.put_nowait("a", item)
+
+    with pytest.raises(QueueFullError) as error:
+        queue.put_nowait("a", 4)
+    # Four jobs at 3s each, two at a time
+    assert error.value.retry_after == 6
+
+
+async def test_retry_after_follows_measured_service_times():
+    queue = FairJobQueue(max_depth=2, concurrency=1, expected_service_seconds=10.0)
+    queue.put_nowait("a", 0)
+    await queue.get()
+    queue.task_done(service_seconds=0.0)
+    assert queue.avg_service_seconds == pytest.approx(8.0)
+
+    queue.put_nowait("a", 1)
+    queue.put_nowait("a", 2)
+    assert queue.retry_after() == 16
+
+
+async def test_retry_after_is_at_least_one_second():
+    queue = FairJobQueue(max_depth=1, concurrency=4, expected_service_seconds=0.01)
+    queue.put_nowait("a", 0)
+    assert queue.retry_after() == 1
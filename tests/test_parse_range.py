@@ -0,0 +1,29 @@
+from core.helper.image import RangeNotSatisfiable, parse_range
+import pytest
+
+LENGTH = 1000
+
+
+@pytest.mark.parametrize("header", [None, "", "items=0-10", "bytes=0-10,20-30", "bytes=10", "bytes=a-10", "bytes=0-b"])
+def test_whole_file_when_header_is_absent_or_unsupported(header):
+    assert parse_range(header, LENGTH) is None
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-0", (0, 0)),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes= 100-199", (100, 199)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=999-999", (999, 999)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_range(header, LENGTH) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5000-6000", "bytes=200-100", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, LENGTH)